@@ -0,0 +1,6 @@
+"""Helper code for *Learning Statistics with Python*.
+
+The modules here are used to build the book: tools for loading the datasets
+in ``Data/``, and faster versions of the simulations and tests used in the
+chapters.
+"""
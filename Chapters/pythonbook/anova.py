@@ -0,0 +1,304 @@
+"""ANOVA from per-group summary statistics (05.03 and 05.05).
+
+Every test here is computed from a ``GroupSummary`` (the size, mean and sum
+of squared deviations of each group) rather than from the raw data, and the
+results are laid out like those of ``pingouin``. ``one_way`` runs the usual
+ANOVA, Welch's ANOVA and Levene's test together while reading the data only
+once::
+
+    one_way(df, dv='mood_gain', between='drug')['welch']
+
+Factorial ANOVAs are computed from a ``CellTable``, the summary of every
+combination of the factors' levels::
+
+    table = CellTable.from_frame(df, 'mood_gain', ['drug', 'therapy'])
+    factorial_anova(table, ss_type=2)
+    marginal_means(table, 'drug')
+"""
+
+from dataclasses import dataclass
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .summaries import GroupSummary, encode
+
+
+def _f_table(summary):
+    k = int((summary.count > 0).sum())
+    ss_b, ss_w = summary.ss_between, summary.ss_within
+    df_b, df_w = k - 1, summary.n - k
+    F = (ss_b / df_b) / (ss_w / df_w)
+    return ss_b, ss_w, df_b, df_w, F
+
+
+def anova(summary, detailed=False):
+    """One-way ANOVA, as ``pg.anova(dv, between, data)`` computes it.
+
+    ``np2`` is eta squared, SSb / (SSb + SSw).
+    """
+    ss_b, ss_w, df_b, df_w, F = _f_table(summary)
+    p = stats.f.sf(F, df_b, df_w)
+    np2 = ss_b / (ss_b + ss_w)
+    source = summary.name or 'between'
+    if not detailed:
+        return pd.DataFrame({'Source': [source], 'ddof1': [df_b],
+                             'ddof2': [df_w], 'F': [F], 'p_unc': [p],
+                             'np2': [np2]})
+    return pd.DataFrame({'Source': [source, 'Within'],
+                         'SS': [ss_b, ss_w],
+                         'DF': [df_b, df_w],
+                         'MS': [ss_b / df_b, ss_w / df_w],
+                         'F': [F, np.nan],
+                         'p_unc': [p, np.nan],
+                         'np2': [np2, np.nan]})
+
+
+def welch_anova(summary):
+    """Welch's ANOVA, which does not assume equal variances.
+
+    Laid out as ``pg.welch_anova``; ``np2`` is the usual eta squared.
+    """
+    nonempty = summary.count > 0
+    n, mean, var = (summary.count[nonempty], summary.mean[nonempty],
+                    summary.var[nonempty])
+    k = len(n)
+    weights = n / var
+    adjusted_mean = (weights * mean).sum() / weights.sum()
+    numerator = (weights * (mean - adjusted_mean) ** 2).sum() / (k - 1)
+    lam = 3 * ((1 - weights / weights.sum()) ** 2 / (n - 1)).sum() / (k * k - 1)
+    F = numerator / (1 + 2 * lam * (k - 2) / 3)
+    df_w = 1 / lam
+    ss_b, ss_w = summary.ss_between, summary.ss_within
+    return pd.DataFrame({'Source': [summary.name or 'between'],
+                         'ddof1': [k - 1], 'ddof2': [df_w], 'F': [F],
+                         'p_unc': [stats.f.sf(F, k - 1, df_w)],
+                         'np2': [ss_b / (ss_b + ss_w)]})
+
+
+def group_medians(values, codes, k):
+    """Median of ``values`` in each of the ``k`` groups given by ``codes``."""
+    # Sort the observations into their groups; a stable sort of small
+    # integers is a radix sort, so this is linear in N
+    order = np.argsort(codes.astype(np.min_scalar_type(k)), kind='stable')
+    ordered = values[order]
+    count = np.bincount(codes, minlength=k)
+    end = np.cumsum(count)
+    return np.array([np.median(ordered[j - n:j]) if n else np.nan
+                     for n, j in zip(count, end)])
+
+
+def _levene(values, codes, summary, center, alpha):
+    if center == 'mean':
+        centers = summary.mean
+    elif center == 'median':
+        centers = group_medians(values, codes, len(summary.levels))
+    else:
+        raise ValueError("center must be 'median' or 'mean', not %r"
+                         % (center,))
+    deviations = np.abs(values - centers[codes])
+    spread = GroupSummary.from_codes(deviations, codes, summary.levels)
+    _, _, df_b, df_w, W = _f_table(spread)
+    p = stats.f.sf(W, df_b, df_w)
+    return pd.DataFrame({'W': [W], 'pval': [p], 'equal_var': [p > alpha]},
+                        index=['levene'])
+
+
+def levene(values, groups, center='median', alpha=0.05):
+    """Levene's test of equal variances, as ``pg.homoscedasticity``.
+
+    With ``center='median'`` (the default, as in scipy and pingouin) this is
+    the Brown-Forsythe version of the test; ``center='mean'`` gives
+    Levene's original test. It is a one-way ANOVA on the absolute
+    deviations of each observation from its group's centre.
+    """
+    values, codes, summary = _prepare(values, groups)
+    return _levene(values, codes, summary, center, alpha)
+
+
+def _prepare(values, groups, name=None):
+    values = np.asarray(values, dtype=float)
+    levels, codes = encode(groups)
+    keep = (codes >= 0) & ~np.isnan(values)
+    values, codes = values[keep], codes[keep]
+    summary = GroupSummary.from_codes(values, codes, levels,
+                                      name or getattr(groups, 'name', None))
+    return values, codes, summary
+
+
+def one_way(data, dv, between, center='median', detailed=False):
+    """ANOVA, Welch's ANOVA and Levene's test of ``dv`` by ``between``.
+
+    The groups are encoded and summarized once, and all three tests share
+    the summary. Returns a dict with the keys ``'summary'`` (the
+    ``GroupSummary``), ``'anova'``, ``'welch'`` and ``'levene'``.
+    """
+    values, codes, summary = _prepare(data[dv], data[between], between)
+    return {'summary': summary,
+            'anova': anova(summary, detailed),
+            'welch': welch_anova(summary),
+            'levene': _levene(values, codes, summary, center, 0.05)}
+
+
+@dataclass
+class CellTable:
+    """Size, mean and sum of squares of every cell of a factorial design.
+
+    ``cells`` is a ``GroupSummary`` with one group for each combination of
+    the levels of ``factors``, in the order of ``itertools.product(*levels)``.
+    ``factorial_anova`` and ``marginal_means`` only use this table, so the
+    data are read once, and their cost depends on the number of cells
+    rather than the number of observations. Tables of separate chunks of
+    data can be merged with ``+``.
+    """
+    factors: list
+    levels: list  # the levels of each factor
+    cells: GroupSummary
+
+    @classmethod
+    def from_frame(cls, data, dv, between):
+        """Tabulate the column ``dv`` of ``data`` by the columns ``between``."""
+        between = [between] if isinstance(between, str) else list(between)
+        levels, codes = zip(*(encode(data[factor]) for factor in between))
+        shape = tuple(len(level) for level in levels)
+        missing = np.any([code < 0 for code in codes], axis=0)
+        cell = np.ravel_multi_index([np.maximum(code, 0) for code in codes],
+                                    shape)
+        cell[missing] = -1
+        index = pd.MultiIndex.from_product(levels, names=between)
+        cells = GroupSummary.from_codes(data[dv], cell, index.to_numpy())
+        return cls(between, list(levels), cells)
+
+    def merge(self, other):
+        """Combine the tables of two disjoint sets of observations."""
+        levels = [pd.Index(a).union(pd.Index(b))
+                  for a, b in zip(self.levels, other.levels)]
+        index = pd.MultiIndex.from_product(levels).to_numpy()
+        cells = self.cells.reindex(index).merge(other.cells.reindex(index))
+        return CellTable(self.factors, [np.asarray(level) for level in levels],
+                         cells)
+
+    __add__ = merge
+
+    @property
+    def shape(self):
+        return tuple(len(level) for level in self.levels)
+
+    def to_frame(self):
+        """The table as a DataFrame with one row per cell."""
+        frame = self.cells.to_frame()
+        frame.index = pd.MultiIndex.from_product(self.levels,
+                                                 names=self.factors)
+        return frame
+
+
+def marginal_means(table, factors, weighted=True):
+    """Means of the outcome for each level of ``factors``.
+
+    ``factors`` is one factor or a list of them. With ``weighted`` these
+    are the observed means, as ``df.groupby(factors)[dv].mean()`` gives;
+    otherwise they are unweighted means of the cell means (the estimated
+    marginal means of the full factorial model), which differ when the
+    design is unbalanced.
+    """
+    factors = [factors] if isinstance(factors, str) else list(factors)
+    keep = sorted(table.factors.index(factor) for factor in factors)
+    drop = tuple(i for i in range(len(table.factors)) if i not in keep)
+    count = table.cells.count.reshape(table.shape).astype(float)
+    mean = np.where(count > 0, table.cells.mean.reshape(table.shape), 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if weighted:
+            result = (count * mean).sum(axis=drop) / count.sum(axis=drop)
+        else:
+            result = mean.sum(axis=drop) / (count > 0).sum(axis=drop)
+    index = pd.MultiIndex.from_product([table.levels[i] for i in keep],
+                                       names=[table.factors[i] for i in keep])
+    result = pd.Series(result.ravel(), index=index, name='mean')
+    if len(factors) == 1:
+        result.index = index.get_level_values(0)
+        return result
+    return result.reorder_levels(factors).sort_index()
+
+
+def _effect_coding(codes, k):
+    # Sum-to-zero contrasts: level j < k - 1 is e_j, the last level is -1
+    columns = np.zeros((len(codes), k - 1))
+    last = codes == k - 1
+    columns[np.flatnonzero(~last), codes[~last]] = 1
+    columns[last] = -1
+    return columns
+
+
+def factorial_anova(table, ss_type=2, effsize='np2'):
+    """Factorial ANOVA of a ``CellTable``, as ``pg.anova`` with several factors.
+
+    The model has every main effect and interaction of the table's factors.
+    ``ss_type`` is 1 (sequential), 2 (each term adjusted for every term that
+    does not contain it) or 3 (each term adjusted for all the others, with
+    sum-to-zero contrasts); they agree when the design is balanced.
+    ``effsize`` is ``'np2'`` (partial eta squared) or ``'n2'``.
+
+    Each model is fitted to the cell means by weighted least squares, with
+    the cell sizes as weights: its residual sum of squares is the
+    within-cell sum of squares plus the weighted squared deviations of the
+    cell means from the model.
+    """
+    if ss_type not in (1, 2, 3):
+        raise ValueError('ss_type must be 1, 2 or 3, not %r' % (ss_type,))
+    if effsize not in ('np2', 'n2'):
+        raise ValueError("effsize must be 'np2' or 'n2', not %r" % (effsize,))
+    cells = table.cells
+    if (cells.count == 0).any():
+        raise ValueError('every combination of the factors needs at least '
+                         'one observation')
+    # Columns of the design matrix, one row per cell, for every term
+    codes = np.unravel_index(np.arange(len(cells.count)), table.shape)
+    coding = [_effect_coding(code, k) for code, k in zip(codes, table.shape)]
+    terms = [term for size in range(1, len(table.factors) + 1)
+             for term in combinations(range(len(table.factors)), size)]
+    columns = {}
+    for term in terms:
+        block = coding[term[0]]
+        for factor in term[1:]:
+            block = np.einsum('ij,ik->ijk', block, coding[factor])
+            block = block.reshape(len(block), -1)
+        columns[term] = block
+    weights = np.sqrt(cells.count)
+    y = cells.mean * weights
+
+    def deviance(model):
+        # Weighted squared deviations of the cell means from the model
+        X = np.column_stack([np.ones(len(y))] + [columns[t] for t in model])
+        X = X * weights[:, None]
+        coef = np.linalg.lstsq(X, y, rcond=None)[0]
+        return np.sum((y - X @ coef) ** 2)
+
+    ss = []
+    for i, term in enumerate(terms):
+        if ss_type == 1:
+            others = terms[:i]
+        elif ss_type == 2:
+            others = [t for t in terms if not set(term) <= set(t)]
+        else:
+            others = [t for t in terms if t != term]
+        ss.append(deviance(others) - deviance(others + [term]))
+    ss = np.array(ss)
+    df = np.array([np.prod([table.shape[f] - 1 for f in term])
+                   for term in terms])
+    ss_resid, df_resid = cells.ss_within, cells.n - len(cells.count)
+    F = ss / df / (ss_resid / df_resid)
+    if effsize == 'np2':
+        effect = ss / (ss + ss_resid)
+    else:
+        effect = ss / (cells.ss_between + ss_resid)
+    sources = [' * '.join(table.factors[f] for f in term) for term in terms]
+    return pd.DataFrame({'Source': sources + ['Residual'],
+                         'SS': np.append(ss, ss_resid),
+                         'DF': np.append(df, df_resid),
+                         'MS': np.append(ss / df, ss_resid / df_resid),
+                         'F': np.append(F, np.nan),
+                         'p_unc': np.append(stats.f.sf(F, df, df_resid),
+                                            np.nan),
+                         effsize: np.append(effect, np.nan)})
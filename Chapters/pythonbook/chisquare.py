@@ -0,0 +1,362 @@
+"""Chi-square tests of categorical data (05.01).
+
+``goodness_of_fit`` tests many categorical columns at once. The counts of
+every column come from one encoding of the whole DataFrame and one
+``np.bincount``, instead of a ``value_counts`` and a ``chisquare`` per
+column::
+
+    df = pd.read_csv('cards.csv')
+    goodness_of_fit(df, ['choice_1', 'choice_2'],
+                    probabilities={'hearts': .3, 'diamonds': .3,
+                                   'spades': .2, 'clubs': .2})
+
+The tests of independence take a ``ContingencyTable``, which is built once
+and shared by all of them::
+
+    table = ContingencyTable.from_frame(df, 'choice', 'species')
+    chi2_independence(table)
+    fisher_exact(table)
+
+With ``reps``, both tests also give a Monte Carlo p-value, which does not
+rely on the chi-square approximation and so can be trusted when expected
+counts are small. Tables are simulated under the null hypothesis in
+vectorized batches: multinomial counts for a goodness-of-fit test, and
+tables with the observed margins (Patefield's algorithm, through
+``scipy.stats.random_table``) for a test of independence. The batches can
+be run in a pool of processes::
+
+    chi2_independence(table, reps=1_000_000, rng=1, workers=4)
+
+The work is split into tasks of ``TASK_REPS`` tables, each with its own
+generator spawned from ``rng``, so a seed gives the same p-values whatever
+the number of workers.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.special import xlogy
+
+from .estimation import default_rng
+from .power import chi2_power
+
+# The power divergence statistics reported by pg.chi2_independence, and their
+# lambda (Cressie and Read, 1984)
+POWER_DIVERGENCE = {'pearson': 1.0,
+                    'cressie-read': 2 / 3,
+                    'log-likelihood': 0.0,
+                    'freeman-tukey': -1 / 2,
+                    'mod-log-likelihood': -1.0,
+                    'neyman': -2.0}
+
+# Tables simulated by each task of a Monte Carlo test, and the largest number
+# of counts simulated at once within a task
+TASK_REPS = 100_000
+BATCH_VALUES = 1_000_000
+
+
+def frequency_table(data, columns=None):
+    """Counts of each level in each column of ``data``.
+
+    Returns a DataFrame with one row per column and one column per level;
+    the levels are those of all the columns together, sorted. Missing values
+    are not counted.
+    """
+    columns = list(data.columns if columns is None else columns)
+    values = data[columns].to_numpy().ravel(order='F')
+    codes, levels = pd.factorize(values, sort=True)
+    k = len(levels)
+    item = np.repeat(np.arange(len(columns)), len(data))
+    keep = codes >= 0
+    counts = np.bincount(item[keep] * k + codes[keep],
+                         minlength=len(columns) * k)
+    return pd.DataFrame(counts.reshape(len(columns), k),
+                        index=pd.Index(columns, name='variable'),
+                        columns=pd.Index(levels, name='level'))
+
+
+def _null_probabilities(counts, probabilities):
+    # One row of probabilities for each row of `counts`, over its columns;
+    # levels that only appear in the probabilities are added to `counts`
+    if probabilities is None:
+        # Equal probabilities of the levels observed in each column, as
+        # chisquare(df[column].value_counts()) assumes
+        observed = (counts > 0).to_numpy()
+        return observed / observed.sum(axis=1, keepdims=True)
+    if isinstance(probabilities, pd.DataFrame):
+        # One column of probabilities for each variable
+        missing = counts.index.difference(probabilities.columns)
+        if len(missing):
+            raise ValueError('no null probabilities for %s'
+                             % ', '.join(map(str, missing)))
+        probabilities = probabilities[counts.index].T
+    else:
+        probabilities = pd.DataFrame([pd.Series(probabilities)] * len(counts),
+                                     index=counts.index)
+    unknown = probabilities.columns.difference(counts.columns)
+    counts[unknown] = 0
+    p = probabilities.reindex(columns=counts.columns).fillna(0).to_numpy()
+    total = p.sum(axis=1)
+    bad = ~np.isclose(total, 1)
+    if bad.any():
+        raise ValueError('the null probabilities of %s sum to %g, not 1'
+                         % (counts.index[bad][0], total[bad][0]))
+    return p
+
+
+def goodness_of_fit(data, columns=None, probabilities=None, reps=None,
+                    rng=None, workers=1):
+    """Chi-square goodness-of-fit test of each column of ``data``.
+
+    ``probabilities`` are the probabilities of the levels under the null
+    hypothesis: a Series or dict shared by every column, or a DataFrame
+    with one column of probabilities (indexed by level) for each variable.
+    Without them each column is tested against equal probabilities of the
+    levels observed in it, as ``chisquare(df[column].value_counts())``.
+
+    Returns a DataFrame with one row per column: the number of
+    observations, X², the degrees of freedom (the number of levels with a
+    non-zero probability, minus one) and the p-value. With ``reps``,
+    ``pval_sim`` is the p-value from that many samples simulated under the
+    null hypothesis, in ``workers`` processes (see the module docstring).
+    """
+    table = frequency_table(data, columns)
+    p = _null_probabilities(table, probabilities)
+    counts = table.to_numpy()
+    impossible = ((p == 0) & (counts > 0)).any(axis=1)
+    if impossible.any():
+        raise ValueError('%s has observations of a level whose null '
+                         'probability is 0' % table.index[impossible][0])
+    n = counts.sum(axis=1)
+    expected = n[:, None] * p
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(p > 0, (counts - expected) ** 2 / expected, 0)
+    chi2 = terms.sum(axis=1)
+    dof = (p > 0).sum(axis=1) - 1
+    result = pd.DataFrame({'n': n, 'chi2': chi2, 'dof': dof,
+                           'pval': stats.chi2.sf(chi2, dof)},
+                          index=table.index)
+    if reps is not None:
+        tests = []
+        for row, prob, size in zip(counts, p, n):
+            cells = prob > 0
+            tests.append((_multinomial, (size, prob[cells]),
+                          size * prob[cells], row[cells][None]))
+        result['pval_sim'] = _simulated_pvalues(tests, [1.0], reps, rng,
+                                                workers)[:, 0]
+    return result
+
+
+def _table_cells(table, correction):
+    # Observed and expected counts of the non-empty cells of a table with
+    # no empty rows or columns, the number of empty cells, and the degrees
+    # of freedom of the table
+    rows, columns = table.row_totals, table.column_totals
+    dof = (len(rows) - 1) * (len(columns) - 1)
+    if table.is_sparse:
+        counts = table.counts.tocoo()
+        observed = counts.data.astype(float)
+        expected = rows[counts.coords[0]] * columns[counts.coords[1]] \
+            / table.n
+    else:
+        observed = table.counts.ravel().astype(float)
+        expected = table.expected().ravel()
+        if dof == 1 and correction:
+            # Yates' correction, which never moves a count past its
+            # expected value
+            diff = expected - observed
+            observed = observed + np.sign(diff) * np.minimum(0.5,
+                                                             np.abs(diff))
+        nonzero = observed > 0
+        observed, expected = observed[nonzero], expected[nonzero]
+    empty = len(rows) * len(columns) - len(observed)
+    return observed, expected, empty, dof
+
+
+def _power_divergence(observed, expected, empty, lambda_):
+    # Sum of the Cressie-Read statistic over the non-empty cells: an empty
+    # cell adds nothing if lambda > -1, and makes the statistic infinite
+    # otherwise
+    if lambda_ <= -1 and empty:
+        return np.inf
+    if lambda_ == 0:
+        return 2 * xlogy(observed, observed / expected).sum()
+    if lambda_ == -1:
+        return 2 * xlogy(expected, expected / observed).sum()
+    return 2 / (lambda_ * (lambda_ + 1)) \
+        * (observed * ((observed / expected) ** lambda_ - 1)).sum()
+
+
+def chi2_independence(table, correction=True, reps=None, rng=None,
+                      workers=1):
+    """Chi-square tests of independence of the two factors of ``table``.
+
+    As the ``stats`` returned by ``pg.chi2_independence``: one row for each
+    of the power divergence statistics in ``POWER_DIVERGENCE``, with Yates'
+    correction of a 2 x 2 table if ``correction``, and Cramér's V and the
+    power of the test computed from each statistic. Levels of either factor
+    that were never observed are left out.
+
+    To match pingouin, the power takes Cramér's V itself as Cohen's w; for
+    a table larger than 2 x 2 that is smaller than the w of ``chi2_power``
+    (V times the square root of ``min(rows, columns) - 1``), and so is the
+    power.
+
+    Only the non-empty cells are visited, so a sparse table is never made
+    dense (Yates' correction applies only to 2 x 2 tables).
+
+    With ``reps``, ``pval_sim`` is the p-value of each statistic, without
+    Yates' correction, among ``reps`` tables with the same margins
+    simulated under independence, in ``workers`` processes (see the module
+    docstring). The simulation needs a dense table.
+    """
+    table = table.nonempty()
+    observed, expected, empty, dof = _table_cells(table, correction)
+    n, k = table.n, min(table.shape) - 1
+    rows = []
+    for name, lambda_ in POWER_DIVERGENCE.items():
+        if dof == 0:
+            chi2, p, cramer, power = 0.0, 1.0, np.nan, np.nan
+        else:
+            chi2 = _power_divergence(observed, expected, empty, lambda_)
+            p = stats.chi2.sf(chi2, dof)
+            cramer = np.sqrt(chi2 / (n * k))
+            # V rather than w, as pingouin does (see the docstring)
+            power = chi2_power(cramer, n, dof)
+        rows.append({'test': name, 'lambda': lambda_, 'chi2': chi2,
+                     'dof': float(dof), 'pval': p, 'cramer': cramer,
+                     'power': power})
+    result = pd.DataFrame(rows)
+    if reps is not None:
+        counts = table.toarray()
+        test = (_patefield, (table.row_totals, table.column_totals),
+                table.expected(), counts[None])
+        result['pval_sim'] = _simulated_pvalues(
+            [test], list(POWER_DIVERGENCE.values()), reps, rng, workers)[0]
+    return result
+
+
+def cramers_v(table):
+    """Cramér's V of ``table``, without Yates' correction.
+
+    As ``scipy.stats.contingency.association(counts, method='cramer')``.
+    """
+    table = table.nonempty()
+    observed, expected, empty, _ = _table_cells(table, correction=False)
+    chi2 = _power_divergence(observed, expected, empty, 1.0)
+    return np.sqrt(chi2 / (table.n * (min(table.shape) - 1)))
+
+
+def fisher_exact(table, alternative='two-sided'):
+    """Fisher's exact test of independence, with ``scipy.stats.fisher_exact``.
+
+    For a 2 x 2 table this returns the odds ratio and the p-value for
+    ``alternative``; a larger table only has a two-sided test, whose
+    statistic is the probability of the observed table.
+    """
+    counts = table.nonempty().toarray()
+    if counts.shape == (2, 2):
+        return stats.fisher_exact(counts, alternative)
+    return stats.fisher_exact(counts)
+
+
+def mcnemar(table, correction=True):
+    """McNemar's test of a 2 x 2 table of paired responses.
+
+    The rows are the responses on the first occasion and the columns those
+    on the second, with their levels in the same order. As the ``stats`` of
+    ``pg.chi2_mcnemar``: the chi-square statistic, with a continuity
+    correction if ``correction``, and the exact binomial p-value.
+    """
+    if table.shape != (2, 2):
+        raise ValueError("McNemar's test needs a 2 x 2 table, not %d x %d"
+                         % table.shape)
+    counts = table.toarray()
+    b, c = int(counts[1, 0]), int(counts[0, 1])
+    if b + c == 0:
+        raise ValueError("McNemar's test needs at least one pair whose "
+                         "responses differ")
+    chi2 = (abs(b - c) - int(correction)) ** 2 / (b + c)
+    return pd.DataFrame({'chi2': chi2, 'dof': 1,
+                         'p_approx': stats.chi2.sf(chi2, 1),
+                         'p_exact': min(1, 2 * stats.binom.cdf(min(b, c),
+                                                               b + c, .5))},
+                        index=['mcnemar'])
+
+
+def _multinomial(rng, size, n, p):
+    return rng.multinomial(n, p, size=size)
+
+
+def _patefield(rng, size, rows, columns):
+    return stats.random_table(rows, columns).rvs(size=size,
+                                                 method='patefield',
+                                                 random_state=rng)
+
+
+def _divergence(observed, expected, lambda_):
+    # Power divergence statistic of each of a batch of tables (the first
+    # axis of `observed`), as _power_divergence
+    axes = tuple(range(1, observed.ndim))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if lambda_ == 1:
+            terms = (observed - expected) ** 2 / expected
+        elif lambda_ == 0:
+            terms = 2 * xlogy(observed, observed / expected)
+        elif lambda_ == -1:
+            terms = 2 * xlogy(expected, expected / observed)
+        else:
+            terms = 2 / (lambda_ * (lambda_ + 1)) \
+                * observed * ((observed / expected) ** lambda_ - 1)
+            # The limit of each term as the count goes to 0
+            terms = np.where(observed > 0, terms,
+                             0 if lambda_ > -1 else np.inf)
+    return terms.sum(axis=axes)
+
+
+def _exceedances(draw, args, expected, lambdas, threshold, size, rng):
+    # How many of `size` simulated tables have statistics of at least
+    # `threshold`, for each lambda
+    count = np.zeros(len(lambdas), dtype=np.int64)
+    batch = max(1, BATCH_VALUES // expected.size)
+    for start in range(0, size, batch):
+        tables = draw(rng, min(batch, size - start), *args)
+        for i, lambda_ in enumerate(lambdas):
+            count[i] += np.sum(_divergence(tables, expected, lambda_)
+                               >= threshold[i])
+        del tables
+    return count
+
+
+def _simulated_pvalues(tests, lambdas, reps, rng, workers):
+    # Monte Carlo p-values, one row per test and one column per lambda.
+    # Each test is (draw, args, expected, observed): draw(rng, size, *args)
+    # simulates `size` tables under the null hypothesis.
+    tasks = []
+    for i, (draw, args, expected, observed) in enumerate(tests):
+        # Statistics within a rounding error of the observed one count as
+        # ties, as in R's chisq.test
+        threshold = [_divergence(observed, expected, lambda_)[0]
+                     * (1 - 64 * np.finfo(float).eps) for lambda_ in lambdas]
+        job = partial(_exceedances, draw, args, expected, lambdas,
+                      threshold)
+        for start in range(0, reps, TASK_REPS):
+            tasks.append((i, job, min(TASK_REPS, reps - start)))
+    rngs = default_rng(rng).spawn(len(tasks))
+    workers = os.cpu_count() if workers is None else workers
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            futures = [pool.submit(job, size, task_rng)
+                       for (_, job, size), task_rng in zip(tasks, rngs)]
+            counts = [future.result() for future in futures]
+    else:
+        counts = [job(size, task_rng)
+                  for (_, job, size), task_rng in zip(tasks, rngs)]
+    exceed = np.zeros((len(tests), len(lambdas)), dtype=np.int64)
+    for (i, _, _), count in zip(tasks, counts):
+        exceed[i] += count
+    return (exceed + 1) / (reps + 1)
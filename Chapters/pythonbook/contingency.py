@@ -0,0 +1,118 @@
+"""Contingency tables of two categorical variables (05.01).
+
+``ContingencyTable`` counts every combination of the levels of two factors
+with one ``np.bincount`` on their integer codes, and the tests in
+``pythonbook.chisquare`` take the table itself, so the data are tabulated
+once rather than once per test::
+
+    table = ContingencyTable.from_frame(df, 'choice', 'species')
+    chi2_independence(table)
+    cramers_v(table)
+
+When the two factors have so many levels that a dense table would not fit
+in memory, the counts are kept in a ``scipy.sparse`` array, which only
+stores the combinations that occur.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .summaries import encode
+
+# Dense tables with more cells than this are stored as sparse arrays
+SPARSE_ABOVE = 10_000_000
+
+
+@dataclass
+class ContingencyTable:
+    """Counts of each combination of the levels of two factors.
+
+    ``counts`` has one row for each of ``levels[0]`` and one column for each
+    of ``levels[1]``; it is a NumPy array, or a ``scipy.sparse`` CSR array
+    for a large table.
+    """
+    factors: list
+    levels: list  # of the rows, and of the columns
+    counts: object
+
+    @classmethod
+    def from_codes(cls, row_codes, column_codes, levels, factors=(None, None),
+                   sparse_above=SPARSE_ABOVE):
+        """Tabulate integer codes (see ``encode``) of the two factors.
+
+        Observations with a negative code in either factor are left out.
+        """
+        shape = tuple(len(level) for level in levels)
+        keep = (row_codes >= 0) & (column_codes >= 0)
+        if not keep.all():
+            row_codes, column_codes = row_codes[keep], column_codes[keep]
+        cell = row_codes.astype(np.int64) * shape[1] + column_codes
+        if shape[0] * shape[1] > sparse_above:
+            cells, count = np.unique(cell, return_counts=True)
+            counts = sparse.csr_array(
+                (count, np.divmod(cells, shape[1])), shape=shape)
+        else:
+            counts = np.bincount(cell, minlength=shape[0] * shape[1])
+            counts = counts.reshape(shape)
+        return cls(list(factors), [np.asarray(level) for level in levels],
+                   counts)
+
+    @classmethod
+    def from_frame(cls, data, row, column, sparse_above=SPARSE_ABOVE):
+        """Tabulate the columns ``row`` and ``column`` of ``data``."""
+        (row_levels, row_codes), (column_levels, column_codes) = (
+            encode(data[row]), encode(data[column]))
+        return cls.from_codes(row_codes, column_codes,
+                              [row_levels, column_levels], [row, column],
+                              sparse_above)
+
+    @property
+    def is_sparse(self):
+        return sparse.issparse(self.counts)
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    @property
+    def n(self):
+        """Total number of observations."""
+        return int(self.counts.sum())
+
+    @property
+    def row_totals(self):
+        return np.asarray(self.counts.sum(axis=1)).ravel()
+
+    @property
+    def column_totals(self):
+        return np.asarray(self.counts.sum(axis=0)).ravel()
+
+    def toarray(self):
+        """The counts as a dense NumPy array."""
+        return self.counts.toarray() if self.is_sparse else self.counts
+
+    def expected(self):
+        """Expected counts if the two factors are independent (dense)."""
+        return np.outer(self.row_totals, self.column_totals) / self.n
+
+    def nonempty(self):
+        """The table without the levels that were never observed."""
+        rows = np.flatnonzero(self.row_totals)
+        columns = np.flatnonzero(self.column_totals)
+        if len(rows) == self.shape[0] and len(columns) == self.shape[1]:
+            return self
+        return ContingencyTable(
+            self.factors, [self.levels[0][rows], self.levels[1][columns]],
+            self.counts[rows][:, columns])
+
+    def to_frame(self):
+        """The table as a DataFrame, laid out like ``pd.crosstab``."""
+        index = pd.Index(self.levels[0], name=self.factors[0])
+        columns = pd.Index(self.levels[1], name=self.factors[1])
+        if self.is_sparse:
+            return pd.DataFrame.sparse.from_spmatrix(self.counts, index,
+                                                     columns)
+        return pd.DataFrame(self.counts, index, columns)
@@ -0,0 +1,234 @@
+"""Load the book's datasets from the local ``Data/`` directory.
+
+The chapters read their data straight from GitHub, e.g.
+``pd.read_csv('https://raw.githubusercontent.com/ethanweed/pythonbook/main/Data/chico.csv')``.
+``load('chico')`` reads the same file from the local checkout instead, so a
+build does not need a network connection, and each file is parsed at most
+once per kernel. Files are checked against ``Data/SHA256SUMS``.
+
+``install()`` makes ``pd.read_csv`` do the same for those URLs, so the code
+in the chapters can stay exactly as the reader sees it. ``run_notebooks.py
+--local-data`` calls it when each kernel starts.
+
+``build_cache()`` converts every CSV file into a typed, uncompressed Feather
+file in ``Data/feather/``, with text columns that have few distinct values
+(``drug``, ``therapy``, ``tutor``, ``species`` ...) stored as categoricals.
+``load`` prefers that file unless the CSV file is newer, and can memory-map
+it. This needs pyarrow; without it the CSV files are always used.
+
+Update the checksums after changing a data file, and rebuild the cache,
+with::
+
+    python -m pythonbook.datasets manifest
+    python -m pythonbook.datasets build
+"""
+
+import hashlib
+import io
+import re
+import sys
+from functools import lru_cache
+from pathlib import Path
+from urllib.request import urlopen
+
+import pandas as pd
+
+try:
+    from pyarrow import feather
+except ImportError:
+    feather = None
+
+DATA_DIR = Path(__file__).resolve().parents[2] / 'Data'
+MANIFEST = DATA_DIR / 'SHA256SUMS'
+CACHE_DIR = DATA_DIR / 'feather'
+BASE_URL = 'https://raw.githubusercontent.com/ethanweed/pythonbook/main/Data/'
+
+# '.../Data/chico.csv', whether a URL or a path on someone else's computer
+DATA_FILE = re.compile(r'(?:^|/)Data/([\w.-]+\.csv)$')
+
+_pandas_read_csv = pd.read_csv
+
+
+def _filename(name):
+    return name if name.endswith('.csv') else name + '.csv'
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def checksums():
+    """Return ``{filename: sha256}`` from ``Data/SHA256SUMS``."""
+    if not MANIFEST.exists():
+        return {}
+    sums = {}
+    for line in MANIFEST.read_text().splitlines():
+        if line.strip():
+            digest, filename = line.split(maxsplit=1)
+            sums[filename.lstrip('*')] = digest
+    return sums
+
+
+def write_manifest():
+    """Write ``Data/SHA256SUMS`` for every CSV file in ``Data/``.
+
+    The file has the same format as the output of ``sha256sum``.
+    """
+    lines = ['%s  %s' % (_sha256(path.read_bytes()), path.name)
+             for path in sorted(DATA_DIR.glob('*.csv'))]
+    MANIFEST.write_text('\n'.join(lines) + '\n')
+    checksums.cache_clear()
+
+
+def _read_bytes(filename):
+    # Local file if there is one, otherwise the copy on GitHub
+    path = DATA_DIR / filename
+    if path.exists():
+        data = path.read_bytes()
+    else:
+        with urlopen(BASE_URL + filename) as response:
+            data = response.read()
+    expected = checksums().get(filename)
+    if expected is not None and _sha256(data) != expected:
+        raise ValueError('%s does not match its checksum in %s'
+                         % (filename, MANIFEST))
+    return data
+
+
+def _columnar_path(filename):
+    return CACHE_DIR / (Path(filename).stem + '.feather')
+
+
+def _has_columnar(filename):
+    # Only use the Feather file if it is at least as new as the CSV file
+    path, csv = _columnar_path(filename), DATA_DIR / filename
+    return (feather is not None and path.exists() and csv.exists()
+            and path.stat().st_mtime >= csv.stat().st_mtime)
+
+
+def to_categorical(df, max_fraction=0.5):
+    """Store text columns with few distinct values as categoricals.
+
+    A column counts as having few values when it has at most
+    ``max_fraction`` times as many distinct values as rows, so that
+    ``drug`` becomes categorical but an ``id`` column does not.
+    """
+    df = df.copy()
+    for column in df.columns:
+        values = df[column]
+        if (pd.api.types.is_string_dtype(values)
+                and values.nunique() <= max_fraction * len(values)):
+            df[column] = values.astype('category')
+    return df
+
+
+def from_categorical(df):
+    # Back to the dtypes pd.read_csv would have given
+    df = df.copy()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(df[column].cat.categories.dtype)
+    return df
+
+
+def build_cache():
+    """Write a typed Feather copy of every CSV file in ``Data/``."""
+    if feather is None:
+        raise ImportError('building the columnar cache requires pyarrow')
+    CACHE_DIR.mkdir(exist_ok=True)
+    for path in sorted(DATA_DIR.glob('*.csv')):
+        df = _pandas_read_csv(io.BytesIO(_read_bytes(path.name)))
+        # Uncompressed, so that the file can be memory-mapped
+        feather.write_feather(to_categorical(df), _columnar_path(path.name),
+                              compression='uncompressed')
+    _parse.cache_clear()
+
+
+def read_table(name, memory_map=True):
+    """Read the Feather copy of a dataset as a ``pyarrow.Table``.
+
+    With ``memory_map`` the columns are not read into memory until used.
+    """
+    filename = _filename(name)
+    if not _has_columnar(filename):
+        raise FileNotFoundError('no up-to-date columnar copy of %s; run '
+                                'build_cache() first' % filename)
+    return feather.read_table(_columnar_path(filename), memory_map=memory_map)
+
+
+@lru_cache(maxsize=32)
+def _parse(filename, options):
+    if not options and _has_columnar(filename):
+        return read_table(filename, memory_map=False).to_pandas()
+    return _pandas_read_csv(io.BytesIO(_read_bytes(filename)), **dict(options))
+
+
+def load(name, categorical=True, memory_map=False, **kwargs):
+    """Read one of the book's datasets, e.g. ``load('chico')``.
+
+    ``kwargs`` are passed on to ``pd.read_csv``. Without them the Feather
+    copy is used if it is up to date; ``categorical=False`` gives the
+    dtypes ``pd.read_csv`` would, even then.
+
+    Parsed files are kept in an LRU cache, and every call returns a new
+    copy, so changing the DataFrame does not affect later calls. With
+    ``memory_map`` the Feather copy is memory-mapped instead and numeric
+    columns are not copied; use this for large files.
+    """
+    filename = _filename(name)
+    if memory_map and not kwargs:
+        df = read_table(filename).to_pandas(split_blocks=True)
+    else:
+        options = tuple(sorted(kwargs.items()))
+        try:
+            hash(options)
+        except TypeError:
+            # e.g. usecols=[...]; parse without caching
+            return _pandas_read_csv(io.BytesIO(_read_bytes(filename)),
+                                    **kwargs)
+        df = _parse(filename, options).copy()
+    return df if categorical else from_categorical(df)
+
+
+def resolve(filepath):
+    """Return the dataset file name for a path or URL into ``Data/``, or None."""
+    if not isinstance(filepath, str):
+        return None
+    match = DATA_FILE.search(filepath)
+    if match is None:
+        return None
+    filename = match.group(1)
+    if filepath.startswith(BASE_URL) or (DATA_DIR / filename).exists():
+        return filename
+    return None
+
+
+def read_csv(filepath_or_buffer, *args, **kwargs):
+    """``pd.read_csv`` that reads the book's datasets with ``load``."""
+    filename = resolve(filepath_or_buffer)
+    if filename is None or args:
+        return _pandas_read_csv(filepath_or_buffer, *args, **kwargs)
+    return load(filename, categorical=False, **kwargs)
+
+
+def install():
+    """Make ``pd.read_csv`` read the book's datasets with ``load``."""
+    pd.read_csv = read_csv
+
+
+def uninstall():
+    pd.read_csv = _pandas_read_csv
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['manifest']:
+        write_manifest()
+    elif sys.argv[1:] == ['build']:
+        build_cache()
+    elif sys.argv[1:] == ['verify']:
+        for filename in checksums():
+            _read_bytes(filename)
+        print('%d files OK' % len(checksums()))
+    else:
+        sys.exit('usage: python -m pythonbook.datasets manifest|build|verify')
@@ -0,0 +1,206 @@
+"""Simulations for the chapter on estimation (04.03).
+
+The figures in that chapter are built from thousands of simulated
+experiments. Rather than drawing one sample at a time in a Python loop, the
+functions here draw all the samples as one ``(reps, n)`` array and reduce
+it along the rows, which is fast enough to use a million replications.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+from scipy import stats
+
+from .moments import Moments
+
+# Statistics that can be given by name. Standard deviations and variances
+# are sample estimates (divide by N - 1), as with statistics.stdev.
+STATISTICS = {
+    'mean': np.mean,
+    'median': np.median,
+    'std': lambda x, axis: np.std(x, axis=axis, ddof=1),
+    'var': lambda x, axis: np.var(x, axis=axis, ddof=1),
+    'max': np.max,
+    'min': np.min,
+    'sum': np.sum,
+}
+
+# Largest number of values drawn at once when reps is large
+CHUNK_VALUES = 10_000_000
+
+
+def default_rng(rng=None):
+    """Return ``rng`` as a ``np.random.Generator`` (a seed also works)."""
+    if isinstance(rng, np.random.Generator):
+        return rng
+    return np.random.default_rng(rng)
+
+
+def draw(sampler, size, rng, dtype=None, **params):
+    """Draw an array of shape ``size``.
+
+    ``sampler`` is the name of a ``np.random.Generator`` method such as
+    ``'normal'`` or ``'beta'``, called with ``params``, a frozen scipy
+    distribution such as ``stats.beta(2, 1)``, or a function
+    ``sampler(rng, size)``.
+    """
+    if hasattr(sampler, 'rvs'):
+        x = sampler.rvs(size=size, random_state=rng)
+    elif callable(sampler):
+        x = sampler(rng, size, **params)
+    else:
+        x = getattr(rng, sampler)(size=size, **params)
+    x = np.asarray(x)
+    return x if dtype is None else x.astype(dtype)
+
+
+def reduce_rows(x, statistic):
+    """Apply ``statistic`` to each row of the 2D array ``x``.
+
+    ``statistic`` is a name from ``STATISTICS``, a ufunc such as
+    ``np.maximum`` (reduced along the rows), or any function that takes an
+    ``axis`` argument.
+    """
+    if isinstance(statistic, str):
+        statistic = STATISTICS[statistic]
+    if isinstance(statistic, np.ufunc):
+        return statistic.reduce(x, axis=1)
+    return statistic(x, axis=1)
+
+
+def sampling_distribution(sampler, n, reps=10000, statistic='mean', rng=None,
+                          dtype=None, **params):
+    """Simulate the sampling distribution of a statistic.
+
+    Draws ``reps`` samples of ``n`` observations each and returns the value
+    of ``statistic`` for every sample. For example, the means of 10,000
+    samples of five IQ scores (rounded down to whole numbers)::
+
+        sampling_distribution('normal', n=5, reps=10000, loc=100, scale=15,
+                              dtype=int)
+
+    Parameters
+    ----------
+    sampler : str, scipy distribution or callable
+        See ``draw``.
+    n : int
+        Sample size.
+    reps : int
+        Number of samples.
+    statistic : str, ufunc or callable
+        See ``reduce_rows``.
+    rng : np.random.Generator or int, optional
+        Random number generator, or a seed for one.
+    dtype : optional
+        Convert the simulated observations to this type before reducing.
+
+    Returns
+    -------
+    np.ndarray of length ``reps``.
+    """
+    rng = default_rng(rng)
+    # Draw in chunks of rows, so that memory use stays bounded for large reps
+    rows = max(1, CHUNK_VALUES // max(n, 1))
+    chunks = [reduce_rows(draw(sampler, (size, n), rng, dtype, **params),
+                          statistic)
+              for size in _chunk_sizes(reps, rows)]
+    return np.concatenate(chunks) if chunks else np.empty(0)
+
+
+@dataclass
+class CLTResult:
+    """Sample means, and the normal distribution the CLT says they follow."""
+    means: np.ndarray
+    mu: float     # population mean
+    sigma: float  # population standard deviation
+    n: int
+
+    @property
+    def se(self):
+        """Standard error of the mean, sigma / sqrt(n)."""
+        return self.sigma / np.sqrt(self.n)
+
+
+def clt_means(source, n, reps=50000, rng=None, **params):
+    """Simulate the sampling distribution of the mean, to illustrate the CLT.
+
+    ``source`` is the population being sampled from, given as for ``draw``:
+    e.g. ``stats.beta(2, 1)``, ``'exponential'`` or ``'uniform'``, or a
+    function ``source(rng, size)``. For a scipy distribution the population
+    mean and standard deviation are exact; otherwise they are estimated from
+    all the simulated observations.
+
+    Returns a ``CLTResult`` with the ``reps`` sample means.
+    """
+    rng = default_rng(rng)
+    rows = max(1, CHUNK_VALUES // max(n, 1))
+    means, moments = [], Moments()
+    for size in _chunk_sizes(reps, rows):
+        x = draw(source, (size, n), rng, **params).astype(float)
+        means.append(x.mean(axis=1))
+        moments.update(x.ravel())
+    means = np.concatenate(means) if means else np.empty(0)
+    if hasattr(source, 'rvs'):
+        mu, sigma = float(source.mean()), float(source.std())
+    else:
+        mu, sigma = float(moments.mean), float(moments.std(ddof=0))
+    return CLTResult(means, mu, sigma, n)
+
+
+@dataclass
+class CoverageResult:
+    """Sample means and confidence intervals of simulated experiments."""
+    n: int
+    means: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+    mu: float     # the true population mean
+    level: float
+
+    @property
+    def covered(self):
+        """Whether each experiment's interval contains the true mean."""
+        return (self.lower <= self.mu) & (self.mu <= self.upper)
+
+    @property
+    def coverage(self):
+        """Proportion of intervals that contain the true mean."""
+        return self.covered.mean()
+
+
+def ci_coverage(n, experiments=50, loc=100, scale=15, level=0.95, rng=None,
+                dtype=None):
+    """Simulate confidence intervals for the mean of normal samples.
+
+    Each of ``experiments`` experiments draws ``n`` observations from a
+    normal distribution with mean ``loc`` and standard deviation ``scale``
+    and computes the t-based ``level`` confidence interval for the mean,
+    as ``t.interval(level, n - 1, loc=mean, scale=sem)`` would.
+
+    ``n`` may also be a list of sample sizes, in which case a list of
+    results is returned, one per sample size.
+
+    Returns a ``CoverageResult``; ``coverage`` is the proportion of
+    intervals that contain ``loc``.
+    """
+    if np.ndim(n):
+        rng = default_rng(rng)
+        return [ci_coverage(size, experiments, loc, scale, level, rng, dtype)
+                for size in n]
+    rng = default_rng(rng)
+    rows = max(1, CHUNK_VALUES // n)
+    means, sems = [], []
+    for size in _chunk_sizes(experiments, rows):
+        x = draw('normal', (size, n), rng, dtype, loc=loc, scale=scale)
+        means.append(x.mean(axis=1))
+        sems.append(x.std(axis=1, ddof=1) / np.sqrt(n))
+    means = np.concatenate(means) if means else np.empty(0)
+    sems = np.concatenate(sems) if sems else np.empty(0)
+    half_width = stats.t.ppf((1 + level) / 2, n - 1) * sems
+    return CoverageResult(n, means, means - half_width, means + half_width,
+                          loc, level)
+
+
+def _chunk_sizes(total, chunk):
+    for start in range(0, total, chunk):
+        yield min(chunk, total - start)
@@ -0,0 +1,20 @@
+"""Sampling distributions for the chapter on hypothesis testing (04.04)."""
+
+from functools import lru_cache
+
+import numpy as np
+from scipy.stats import binom
+
+
+@lru_cache(maxsize=None)
+def binomial_pmf(n, p):
+    """Exact sampling distribution of a binomial count.
+
+    Returns the support ``k = 0, 1, ..., n`` and ``binom.pmf(k, n, p)``.
+    Results are cached per ``(n, p)``, so the arrays are read-only.
+    """
+    k = np.arange(n + 1)
+    pmf = binom.pmf(k, n, p)
+    k.flags.writeable = False
+    pmf.flags.writeable = False
+    return k, pmf
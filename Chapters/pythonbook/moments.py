@@ -0,0 +1,97 @@
+"""Streaming mean, variance, skewness and kurtosis.
+
+``Moments`` keeps the count, the mean and the sums of squared, cubed and
+fourth-power deviations from the mean, and updates them one batch at a
+time, so a simulation never has to hold all of its values in memory.
+Batches are combined with the pairwise formulas of Pébay (2008), "Formulas
+for robust, one-pass parallel computation of covariances and arbitrary-order
+statistical moments", which extend Welford's running variance to higher
+moments and stay accurate when the mean is large compared to the spread.
+"""
+
+import numpy as np
+
+
+class Moments:
+    """Running moments of a stream of values.
+
+    Each ``update`` takes a batch of values along ``axis``; any other axes
+    are kept, so one ``Moments`` can track, e.g., a statistic for several
+    sample sizes at once. Two accumulators can be combined with ``merge``
+    (or ``+``), e.g. when batches were simulated in separate processes.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.m4 = 0.0
+
+    @classmethod
+    def from_values(cls, values, axis=0):
+        """Moments of ``values`` along ``axis``, computed directly."""
+        values = np.asarray(values, dtype=float)
+        moments = cls()
+        moments.n = values.shape[axis]
+        if moments.n:
+            moments.mean = values.mean(axis=axis)
+            d = values - np.expand_dims(moments.mean, axis)
+            d2 = d * d
+            moments.m2 = d2.sum(axis=axis)
+            moments.m3 = (d2 * d).sum(axis=axis)
+            moments.m4 = (d2 * d2).sum(axis=axis)
+        return moments
+
+    def update(self, values, axis=0):
+        """Add a batch of values; returns ``self``."""
+        return self.merge(Moments.from_values(values, axis), inplace=True)
+
+    def merge(self, other, inplace=False):
+        """Combine two sets of moments (Pébay's pairwise update)."""
+        out = self if inplace else Moments()
+        if other.n == 0 or self.n == 0:
+            source = self if other.n == 0 else other
+            out.n, out.mean = source.n, source.mean
+            out.m2, out.m3, out.m4 = source.m2, source.m3, source.m4
+            return out
+        na, nb = self.n, other.n
+        n = na + nb
+        delta = other.mean - self.mean
+        delta_n = delta / n
+        delta_n2 = delta_n * delta_n
+        term = delta * delta_n * na * nb
+        m4 = (self.m4 + other.m4
+              + term * delta_n2 * (na * na - na * nb + nb * nb)
+              + 6 * delta_n2 * (na * na * other.m2 + nb * nb * self.m2)
+              + 4 * delta_n * (na * other.m3 - nb * self.m3))
+        m3 = (self.m3 + other.m3
+              + term * delta_n * (na - nb)
+              + 3 * delta_n * (na * other.m2 - nb * self.m2))
+        m2 = self.m2 + other.m2 + term
+        out.mean = self.mean + delta_n * nb
+        out.n, out.m2, out.m3, out.m4 = n, m2, m3, m4
+        return out
+
+    __add__ = merge
+
+    def var(self, ddof=1):
+        """Variance; by default the sample estimate (divide by N - 1)."""
+        return self.m2 / (self.n - ddof) if self.n > ddof else np.nan * self.m2
+
+    def std(self, ddof=1):
+        return np.sqrt(self.var(ddof))
+
+    @property
+    def skew(self):
+        """Skewness, as ``scipy.stats.skew`` (biased) computes it."""
+        return np.sqrt(self.n) * self.m3 / self.m2 ** 1.5
+
+    @property
+    def kurtosis(self):
+        """Excess kurtosis, as ``scipy.stats.kurtosis`` (biased) computes it."""
+        return self.n * self.m4 / (self.m2 * self.m2) - 3
+
+    def __repr__(self):
+        return ('Moments(n=%r, mean=%r, var=%r)'
+                % (self.n, self.mean, self.var()))
@@ -0,0 +1,82 @@
+"""Plotting helpers for the figures in the book."""
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.collections import LineCollection
+
+from .estimation import default_rng
+from .hypothesis import binomial_pmf
+
+
+def plot_binomial(n, p, retain=None, ax=None, exact=True, size=10000,
+                  rng=None, color=None, retain_color='lightgrey', width=0.5):
+    """Plot the sampling distribution of a binomial count X.
+
+    The bars show how often each value of X turns up in ``size`` samples.
+    With ``exact`` (the default) those are the expected counts,
+    ``size * binom.pmf(k, n, p)``, so the figure is the same every time and
+    nothing is simulated; otherwise ``size`` samples are drawn with ``rng``.
+
+    ``retain`` is the range ``(low, high)`` of values, inclusive, for which
+    the null hypothesis is retained. These are drawn in ``retain_color``, so
+    that the critical region stands out; use ``None`` for an open end, e.g.
+    ``(None, 58)`` for a one-sided test.
+
+    Returns the axes.
+    """
+    if ax is None:
+        ax = plt.gca()
+    if exact:
+        k, pmf = binomial_pmf(n, p)
+        counts = size * pmf
+    else:
+        k = np.arange(n + 1)
+        counts = np.bincount(default_rng(rng).binomial(n, p, size),
+                             minlength=n + 1)
+    colors = np.full(k.shape, color or 'C0', dtype=object)
+    if retain is not None:
+        low, high = retain
+        mask = np.ones(k.shape, dtype=bool)
+        if low is not None:
+            mask &= k >= low
+        if high is not None:
+            mask &= k <= high
+        colors[mask] = retain_color
+    ax.bar(k, counts, width=width, align='edge', color=colors)
+    ax.set_ylabel('Count')
+    return ax
+
+
+# Above this many segments, residual lines are drawn as an image in vector
+# output (SVG, PDF), so the file size does not grow with the data
+RASTERIZE_ABOVE = 5000
+
+
+def plot_residuals(x, observed, fitted, ax=None, colors=None,
+                   rasterize_above=RASTERIZE_ABOVE, **kwargs):
+    """Draw a vertical line from each observed value to its fitted value.
+
+    All the lines are one ``LineCollection``, rather than one ``Line2D``
+    per observation, so drawing stays fast for large data sets. By default
+    the lines take the next colours of the axes' own property cycle, one
+    each, as separate ``ax.plot`` calls would; ``colors`` may be one colour
+    or one per line. ``kwargs`` are passed on to ``LineCollection``, e.g.
+    ``linewidths`` or ``linestyles``.
+
+    Returns the ``LineCollection``.
+    """
+    if ax is None:
+        ax = plt.gca()
+    x = np.asarray(x, dtype=float)
+    segments = np.stack([np.column_stack([x, np.asarray(observed, float)]),
+                         np.column_stack([x, np.asarray(fitted, float)])],
+                        axis=1)
+    if colors is None:
+        colors = [ax._get_lines.get_next_color()
+                  for _ in range(len(segments))]
+    lines = LineCollection(segments, colors=colors, **kwargs)
+    if rasterize_above is not None and len(segments) > rasterize_above:
+        lines.set_rasterized(True)
+    ax.add_collection(lines)
+    ax.autoscale_view()
+    return lines
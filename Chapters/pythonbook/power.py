@@ -0,0 +1,166 @@
+"""Power functions for the tests in the book.
+
+Each function gives the probability that a test rejects the null hypothesis,
+as a function of the true effect, the sample size and the significance
+level. All arguments broadcast against each other like numpy arrays, so a
+whole power surface is computed with a few scipy calls and no Python loop::
+
+    theta = np.linspace(0.01, 0.99, 99)
+    n = np.arange(10, 1001)
+    binomial_power(theta[:, None], n)           # shape (99, 991)
+    power_grid(t_power, d, n, alpha=[.01, .05])  # shape (len(d), 991, 2)
+
+The critical values of a test depend only on ``n`` and ``alpha``, not on
+the true effect, so they are computed once for each design point and then
+reused for every value of ``theta`` or ``d``.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+from scipy.stats import binom, chi2, nct, ncx2, norm
+from scipy.stats import t as t_dist
+
+ALTERNATIVES = ('two-sided', 'greater', 'less')
+
+
+def _tail_levels(alpha, alternative):
+    # The level spent in the (lower, upper) tail; 0 means no critical region
+    alpha = np.asarray(alpha, dtype=float)
+    if alternative == 'two-sided':
+        return alpha / 2, alpha / 2
+    if alternative == 'greater':
+        return np.zeros_like(alpha), alpha
+    if alternative == 'less':
+        return alpha, np.zeros_like(alpha)
+    raise ValueError('alternative must be one of %s, not %r'
+                     % (', '.join(ALTERNATIVES), alternative))
+
+
+def binomial_critical_values(n, alpha=0.05, p0=0.5, alternative='two-sided'):
+    """Critical values of the exact binomial test of ``theta = p0``.
+
+    Returns ``(lower, upper)``: the null hypothesis is rejected when
+    ``X <= lower`` or ``X >= upper``. Each tail has probability at most
+    ``alpha / 2`` under the null (``alpha`` for a one-sided test), so the
+    test is conservative. A tail with no critical region has
+    ``lower = -1`` or ``upper = n + 1``.
+
+    For N = 100 and alpha = .05 these are 39 and 61. (The chapter's rule
+    of thumb, ``X <= 40`` or ``X >= 60``, has a level of about .057.)
+    """
+    if np.ndim(n) == 0 and np.ndim(alpha) == 0:
+        return _binomial_critical_values(int(n), float(alpha), float(p0),
+                                         alternative)
+    return _critical_values(n, alpha, p0, alternative)
+
+
+@lru_cache(maxsize=1024)
+def _binomial_critical_values(n, alpha, p0, alternative):
+    lower, upper = _critical_values(n, alpha, p0, alternative)
+    return int(lower), int(upper)
+
+
+def _critical_values(n, alpha, p0, alternative):
+    n = np.asarray(n)
+    low_tail, high_tail = _tail_levels(alpha, alternative)
+    # ppf gives the smallest k with P(X <= k) >= q; step back one unless
+    # P(X <= k) is exactly q
+    k = binom.ppf(low_tail, n, p0)
+    lower = np.where(binom.cdf(k, n, p0) <= low_tail, k, k - 1)
+    # isf gives the smallest k with P(X > k) <= q
+    upper = binom.isf(high_tail, n, p0) + 1
+    lower = np.where(low_tail > 0, lower, -1)
+    upper = np.where(high_tail > 0, upper, n + 1)
+    return lower.astype(int), upper.astype(int)
+
+
+def rejection_probability(theta, n, lower, upper):
+    """Probability that ``X <= lower`` or ``X >= upper`` for X ~ Bin(n, theta).
+
+    The upper tail uses ``binom.sf`` rather than ``1 - binom.cdf``, which
+    loses all precision once the tail probability is below about 1e-16.
+    """
+    return binom.cdf(lower, n, theta) + binom.sf(np.asarray(upper) - 1, n,
+                                                 theta)
+
+
+def binomial_power(theta, n, alpha=0.05, p0=0.5, alternative='two-sided'):
+    """Power of the exact binomial test of ``theta = p0``.
+
+    ``theta`` is the true probability of success. This is the power
+    function plotted in the chapter on hypothesis testing (04.04).
+    """
+    lower, upper = binomial_critical_values(n, alpha, p0, alternative)
+    return rejection_probability(theta, n, lower, upper)
+
+
+def z_power(d, n, alpha=0.05, alternative='two-sided'):
+    """Power of the one-sample z-test.
+
+    ``d`` is the effect size, ``(mu - mu0) / sigma``.
+    """
+    return _power(norm, d * np.sqrt(n), alpha, alternative)
+
+
+def t_power(d, n, alpha=0.05, alternative='two-sided'):
+    """Power of the one-sample (or paired samples) t-test.
+
+    ``d`` is Cohen's d, ``(mu - mu0) / sigma``; the test statistic has a
+    noncentral t distribution with ``n - 1`` degrees of freedom and
+    noncentrality ``d * sqrt(n)``.
+    """
+    n = np.asarray(n, dtype=float)
+    return _power(t_dist, d * np.sqrt(n), alpha, alternative, df=n - 1)
+
+
+def two_sample_t_power(d, n1, n2=None, alpha=0.05, alternative='two-sided'):
+    """Power of Student's independent samples t-test.
+
+    ``d`` is Cohen's d, the difference between the population means divided
+    by their common standard deviation, and ``n1`` and ``n2`` are the group
+    sizes (equal by default).
+    """
+    n1 = np.asarray(n1, dtype=float)
+    n2 = n1 if n2 is None else np.asarray(n2, dtype=float)
+    ncp = d * np.sqrt(n1 * n2 / (n1 + n2))
+    return _power(t_dist, ncp, alpha, alternative, df=n1 + n2 - 2)
+
+
+def chi2_power(w, n, dof, alpha=0.05):
+    """Power of a chi-square test with ``dof`` degrees of freedom.
+
+    ``w`` is Cohen's effect size w (Cramér's V times the square root of
+    ``min(rows, columns) - 1`` for a test of independence).
+    """
+    return ncx2.sf(chi2.isf(alpha, dof), dof, n * np.square(w))
+
+
+def _power(null, ncp, alpha, alternative, df=None):
+    # Power of a test whose statistic has distribution `null` (norm or t)
+    # under the null hypothesis and is shifted by ncp under the alternative
+    low_tail, high_tail = _tail_levels(alpha, alternative)
+    args = () if df is None else (df,)
+    # Critical values depend only on (n, alpha); an empty tail gets an
+    # infinite critical value and so contributes nothing
+    with np.errstate(divide='ignore'):
+        low = np.where(low_tail > 0, null.ppf(low_tail, *args), -np.inf)
+        high = np.where(high_tail > 0, null.isf(high_tail, *args), np.inf)
+    if df is None:
+        return norm.sf(ncp - low) + norm.sf(high - ncp)
+    # The lower tail is written as an upper tail of -T, which has noncentrality
+    # -ncp: nct.cdf returns nan for some very small tail probabilities
+    return nct.sf(-low, df, -ncp) + nct.sf(high, df, ncp)
+
+
+def power_grid(power, effect, n, alpha=0.05, **kwargs):
+    """Evaluate ``power`` on every combination of effect, n and alpha.
+
+    ``power`` is one of the functions above, and ``effect``, ``n`` and
+    ``alpha`` are 1D sequences (or scalars). Returns an array of shape
+    ``(len(effect), len(n), len(alpha))``, e.g. for finding the smallest
+    sample size with a power of at least .8 for each effect size.
+    """
+    effect, n, alpha = np.ix_(np.atleast_1d(effect), np.atleast_1d(n),
+                              np.atleast_1d(alpha))
+    return power(effect, n, alpha=alpha, **kwargs)
@@ -0,0 +1,37 @@
+"""Simulations for the chapter on probability (04.02)."""
+
+import numpy as np
+import pandas as pd
+
+from .estimation import default_rng
+
+
+def running_proportions(n, runs=1, p=0.5, rng=None, dtype=float):
+    """Simulate the law of large numbers for a coin.
+
+    Flips ``runs`` sequences of ``n`` coins that come up heads with
+    probability ``p``, all with one call to the generator, and returns a
+    ``(runs, n)`` array with the proportion of heads after each flip. Use
+    ``dtype=np.float32`` to halve the memory needed for very long runs.
+    """
+    rng = default_rng(rng)
+    heads = rng.random((runs, n)) < p
+    proportions = np.cumsum(heads, axis=1, dtype=dtype)
+    proportions /= np.arange(1, n + 1, dtype=dtype)
+    return proportions
+
+
+def coin_flip_runs(n, runs=4, p=0.5, rng=None):
+    """``running_proportions`` as a long-form DataFrame, e.g. for seaborn.
+
+    The columns are ``flips`` (1 to ``n``), ``proportion_heads`` and
+    ``runs``, a categorical labelling the runs 'run1', 'run2', ...
+    """
+    proportions = running_proportions(n, runs, p, rng)
+    labels = ['run%d' % (i + 1) for i in range(runs)]
+    return pd.DataFrame({
+        'flips': np.tile(np.arange(1, n + 1), runs),
+        'proportion_heads': proportions.ravel(),
+        'runs': pd.Categorical.from_codes(np.repeat(np.arange(runs), n),
+                                          labels),
+    })
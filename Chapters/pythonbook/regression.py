@@ -0,0 +1,249 @@
+"""Least-squares regression for the chapter on linear regression (05.04).
+
+``linear_fit`` solves the least-squares problem directly, from a QR
+decomposition of the design matrix, instead of searching for the
+coefficients with an optimizer such as ``scipy.optimize.curve_fit``. The
+answer is exact, and the decomposition is shared by every outcome column, so
+the same predictors can be fitted to many outcomes (e.g. thousands of
+simulated data sets) at once.
+"""
+
+from dataclasses import dataclass
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.linalg import solve_triangular
+
+
+def design_matrix(x, intercept=True):
+    """Predictors as a 2D float array, with a column of ones first.
+
+    ``x`` is a 1D array (a single predictor), or a 2D array or DataFrame
+    with one column per predictor.
+    """
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 1:
+        x = x[:, None]
+    if intercept:
+        x = np.column_stack([np.ones(len(x)), x])
+    return x
+
+
+def _check_rank(R):
+    # R is the triangular factor of the design matrix
+    diagonal = np.abs(np.diag(R))
+    if diagonal.size and diagonal.min() <= 1e-12 * diagonal.max():
+        raise np.linalg.LinAlgError('the predictors are linearly dependent')
+
+
+def _qr(X):
+    Q, R = np.linalg.qr(X)
+    _check_rank(R)
+    return Q, R
+
+
+@dataclass
+class LinearFit:
+    """A least-squares fit of one or more outcomes on the same predictors.
+
+    With a single outcome ``coef``, ``fitted`` and ``residuals`` are 1D and
+    ``cov`` is ``(p, p)``. With ``k`` outcome columns they gain a last axis
+    of length ``k`` and ``cov`` has shape ``(k, p, p)``.
+    """
+    coef: np.ndarray       # intercept first, then one slope per predictor
+    fitted: np.ndarray
+    residuals: np.ndarray
+    cov: np.ndarray        # covariance matrix of coef
+    df_resid: int
+    intercept: bool = True
+
+    @property
+    def ss_resid(self):
+        """Residual sum of squares."""
+        return np.sum(self.residuals ** 2, axis=0)
+
+    @property
+    def sigma(self):
+        """Residual standard error."""
+        return np.sqrt(self.ss_resid / self.df_resid)
+
+    @property
+    def se(self):
+        """Standard errors of the coefficients."""
+        return np.sqrt(np.diagonal(self.cov, axis1=-2, axis2=-1)).T
+
+    def predict(self, x):
+        """Predicted values of the outcome(s) at new values ``x``."""
+        return design_matrix(x, self.intercept) @ self.coef
+
+
+def linear_fit(x, y, intercept=True):
+    """Least-squares regression of ``y`` on ``x``.
+
+    ``x`` holds one or more predictors (see ``design_matrix``), and ``y``
+    one or more outcomes: a 1D array, or a 2D array or DataFrame with one
+    column per outcome, all fitted at once. For a straight line::
+
+        fit = linear_fit(df['dan_sleep'], df['dan_grump'])
+        intercept, slope = fit.coef
+
+    Returns a ``LinearFit``.
+    """
+    X = design_matrix(x, intercept)
+    y = np.asarray(y, dtype=float)
+    Q, R = _qr(X)
+    coef = solve_triangular(R, Q.T @ y)
+    fitted = X @ coef
+    residuals = y - fitted
+    df_resid = X.shape[0] - X.shape[1]
+    # cov(coef) = sigma^2 (X'X)^-1, and (X'X)^-1 = R^-1 R^-T
+    R_inv = solve_triangular(R, np.eye(R.shape[0]))
+    unscaled = R_inv @ R_inv.T
+    sigma2 = np.sum(residuals ** 2, axis=0) / df_resid
+    cov = np.multiply.outer(sigma2, unscaled)
+    return LinearFit(coef, fitted, residuals, cov, df_resid, intercept)
+
+
+def influence(x, y, intercept=True):
+    """Regression diagnostics for every observation.
+
+    Fits ``y`` on ``x`` (see ``linear_fit``) and returns a DataFrame with
+    one row per observation and the columns
+
+    - ``leverage``: the hat value h, the diagonal of the hat matrix;
+    - ``residual``: the ordinary residual e;
+    - ``standardized``: the internally studentized residual,
+      ``e / (s * sqrt(1 - h))``;
+    - ``studentized``: the externally studentized residual, which uses the
+      residual standard error s(i) of the model fitted without that
+      observation;
+    - ``p`` and ``p_bonferroni``: two-sided p-values of the studentized
+      residual as an outlier test, as in statsmodels' ``outlier_test``;
+    - ``cooks_d``: Cook's distance;
+    - ``dffits``.
+
+    Nothing is refitted: the hat values are the squared row norms of Q in
+    the thin QR decomposition of the design matrix, and the leave-one-out
+    quantities follow from the identity
+    ``(N - p - 1) s(i)^2 = (N - p) s^2 - e^2 / (1 - h)``.
+    """
+    index = getattr(y, 'index', None)
+    X = design_matrix(x, intercept)
+    y = np.asarray(y, dtype=float)
+    n, p = X.shape
+    Q, _ = _qr(X)
+    leverage = np.einsum('ij,ij->i', Q, Q)
+    residual = y - Q @ (Q.T @ y)
+    ss_resid = residual @ residual
+    one_minus_h = 1 - leverage
+    s = np.sqrt(ss_resid / (n - p))
+    s_loo = np.sqrt((ss_resid - residual ** 2 / one_minus_h) / (n - p - 1))
+    standardized = residual / (s * np.sqrt(one_minus_h))
+    studentized = residual / (s_loo * np.sqrt(one_minus_h))
+    p_value = 2 * stats.t.sf(np.abs(studentized), n - p - 1)
+    return pd.DataFrame({
+        'leverage': leverage,
+        'residual': residual,
+        'standardized': standardized,
+        'studentized': studentized,
+        'p': p_value,
+        'p_bonferroni': np.minimum(p_value * n, 1),
+        'cooks_d': standardized ** 2 * leverage / (p * one_minus_h),
+        'dffits': studentized * np.sqrt(leverage / one_minus_h),
+    }, index=index)
+
+
+def _subset_positions(subset, columns):
+    # Positions of the predictors in `subset`, given by name or by position
+    if isinstance(subset, (str, int, np.integer)):
+        subset = [subset]
+    return [columns.index(s) if isinstance(s, str) else int(s)
+            for s in subset]
+
+
+def all_subsets(columns, min_size=1, max_size=None):
+    """Every combination of ``columns``, e.g. for an all-subsets screen."""
+    max_size = len(columns) if max_size is None else max_size
+    return [list(c) for size in range(min_size, max_size + 1)
+            for c in combinations(columns, size)]
+
+
+def regression_f(x, y, subsets=None, partial=False):
+    """F-tests for many regression models that share their data.
+
+    ``x`` is a DataFrame (or 2D array) of candidate predictors and ``y``
+    one or more outcomes, as for ``linear_fit``. Each item of ``subsets``
+    is a list of predictors, by name or position, and defines one model
+    (with an intercept); by default there is a single model with all of
+    them. For each model and outcome this gives the F-test of the model
+    against the intercept-only model, as in the chapter's
+    ``regression_f``, or with ``partial`` the F-test of the model against
+    the full model with every predictor in ``x``, as in
+    ``anova_lm(model, full_model)``.
+
+    ``[X Y]`` is decomposed once, as ``QR``. The residual sum of squares of
+    any submodel can be computed from the small triangular factor R alone,
+    since ``|X_S b - y| = |R_S b - r_y|``, so each extra model costs a QR
+    decomposition of a ``(p + 1) x |S|`` matrix rather than a refit on all
+    N observations.
+
+    Returns a DataFrame with one row per model (and outcome), with columns
+    ``predictors``, ``outcome``, ``R2``, ``F``, ``df1``, ``df2`` and ``p``.
+    """
+    X = design_matrix(x)
+    n, n_predictors = len(X), X.shape[1] - 1
+    columns = [str(c) for c in getattr(x, 'columns', [])]
+    columns = columns or ['x%d' % i for i in range(n_predictors)]
+    Y = np.asarray(y, dtype=float).reshape(n, -1)
+    if hasattr(y, 'columns'):
+        outcomes = list(y.columns)
+    elif np.ndim(y) == 1:
+        outcomes = [getattr(y, 'name', None) or 'y']
+    else:
+        outcomes = ['y%d' % j for j in range(Y.shape[1])]
+    R = np.linalg.qr(np.column_stack([X, Y]), mode='r')
+    _check_rank(R[:X.shape[1], :X.shape[1]])
+    r_y = R[:, X.shape[1]:]
+
+    def rss(positions):
+        # Residual sum of squares of y on the intercept and these predictors
+        Q = np.linalg.qr(R[:, [0] + [p + 1 for p in positions]])[0]
+        residual = r_y - Q @ (Q.T @ r_y)
+        return np.sum(residual ** 2, axis=0)
+
+    ss_tot = rss([])
+    all_positions = list(range(n_predictors))
+    ss_full = rss(all_positions) if partial else None
+    if subsets is None:
+        subsets = [all_positions]
+    names, ss_res, df1 = [], [], []
+    for subset in subsets:
+        positions = _subset_positions(subset, columns)
+        names.append(' + '.join(columns[p] for p in positions) or '1')
+        ss_res.append(rss(positions))
+        df1.append(len(positions))
+    # One row per (model, outcome)
+    ss_res = np.array(ss_res).ravel()
+    df1 = np.repeat(df1, len(outcomes))
+    ss_tot = np.tile(ss_tot, len(names))
+    if partial:
+        df1 = n_predictors - df1
+        df2 = n - n_predictors - 1
+        ss_full = np.tile(ss_full, len(names))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            F = (ss_res - ss_full) / df1 / (ss_full / df2)
+    else:
+        df2 = n - df1 - 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            F = (ss_tot - ss_res) / df1 / (ss_res / df2)
+    return pd.DataFrame({
+        'predictors': np.repeat(names, len(outcomes)),
+        'outcome': np.tile(outcomes, len(names)),
+        'R2': 1 - ss_res / ss_tot,
+        'F': F,
+        'df1': df1,
+        'df2': df2,
+        'p': stats.f.sf(F, df1, df2),
+    })
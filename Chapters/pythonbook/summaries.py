@@ -0,0 +1,180 @@
+"""Per-group summary statistics for the comparison of means (05.02-05.05).
+
+The t-tests and ANOVAs in those chapters only depend on the size, mean and
+sum of squared deviations of each group. ``GroupSummary`` computes these
+for every group in a single pass, with ``np.bincount`` on integer group
+codes, and the tests in ``pythonbook.anova`` and ``pythonbook.ttest`` are
+computed from it.
+
+Summaries of separate parts of a data set can be merged, with the pairwise
+update of Chan, Golub and LeVeque (1979), so a file too large for memory can
+be tested one chunk at a time::
+
+    chunks = pd.read_csv('clintrial.csv', chunksize=100000)
+    summary = GroupSummary.from_chunks(chunks, 'mood_gain', 'drug')
+
+and summaries computed in different processes can be added together.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+def encode(groups):
+    """Integer codes for the group labels: returns ``(levels, codes)``.
+
+    Levels are sorted, as with ``groupby``; a categorical keeps the order of
+    its categories, including any that are empty. Missing labels get the
+    code -1.
+    """
+    if isinstance(getattr(groups, 'dtype', None), pd.CategoricalDtype):
+        groups = pd.Series(groups)
+        return np.asarray(groups.cat.categories), groups.cat.codes.to_numpy()
+    codes, levels = pd.factorize(np.asarray(groups), sort=True)
+    return np.asarray(levels), codes
+
+
+@dataclass
+class GroupSummary:
+    """Size, mean and sum of squared deviations from the mean of each group.
+
+    ``m2`` is the sum of squared deviations, so the variance of a group is
+    ``m2 / (count - 1)``.
+    """
+    levels: np.ndarray
+    count: np.ndarray
+    mean: np.ndarray
+    m2: np.ndarray
+    name: str = None  # of the grouping variable
+
+    @classmethod
+    def from_codes(cls, values, codes, levels, name=None):
+        """Summarize ``values`` by integer group ``codes`` (see ``encode``).
+
+        Observations whose value is missing, or whose code is negative,
+        are left out.
+        """
+        values = np.asarray(values, dtype=float)
+        keep = (codes >= 0) & ~np.isnan(values)
+        if not keep.all():
+            values, codes = values[keep], codes[keep]
+        k = len(levels)
+        # Sums of deviations from the grand mean, rather than of the values
+        # themselves, so that the sums of squares do not lose precision
+        shift = values.mean() if len(values) else 0.0
+        d = values - shift
+        count = np.bincount(codes, minlength=k)
+        total = np.bincount(codes, weights=d, minlength=k)
+        total_sq = np.bincount(codes, weights=d * d, minlength=k)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = total / count
+        m2 = np.maximum(total_sq - total * np.where(count, mean, 0), 0)
+        return cls(np.asarray(levels), count, shift + mean, m2, name)
+
+    @classmethod
+    def from_data(cls, values, groups, name=None):
+        """Summarize ``values`` by the group labels ``groups``."""
+        levels, codes = encode(groups)
+        return cls.from_codes(values, codes, levels,
+                              name or getattr(groups, 'name', None))
+
+    @classmethod
+    def from_frame(cls, data, dv, between):
+        """Summarize the column ``dv`` of ``data`` by the column ``between``."""
+        return cls.from_data(data[dv], data[between], between)
+
+    @classmethod
+    def from_chunks(cls, chunks, dv, between):
+        """Summarize an iterable of DataFrames, e.g. from ``read_csv``."""
+        summary = None
+        for chunk in chunks:
+            part = cls.from_frame(chunk, dv, between)
+            summary = part if summary is None else summary.merge(part)
+        if summary is None:
+            raise ValueError('no data to summarize')
+        return summary
+
+    def merge(self, other):
+        """Combine the summaries of two disjoint sets of observations.
+
+        Groups are matched by their label; a group in only one of the two
+        summaries is kept as it is. ``a + b`` is the same as
+        ``a.merge(b)``.
+        """
+        if (len(self.levels) == len(other.levels)
+                and (self.levels == other.levels).all()):
+            levels, a, b = self.levels, self, other
+        else:
+            levels = pd.Index(self.levels).union(pd.Index(other.levels))
+            a, b = self.reindex(levels), other.reindex(levels)
+        count = a.count + b.count
+        mean_a = np.where(a.count, a.mean, 0)
+        mean_b = np.where(b.count, b.mean, 0)
+        delta = mean_b - mean_a
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.where(count, b.count / count, 0)
+            mean = np.where(count, mean_a + delta * weight, np.nan)
+        m2 = a.m2 + b.m2 + delta * delta * a.count * weight
+        return GroupSummary(np.asarray(levels), count, mean, m2,
+                            self.name or other.name)
+
+    __add__ = merge
+
+    def reindex(self, levels):
+        """The summary for the groups ``levels``, in that order.
+
+        Groups that are not in the summary are empty.
+        """
+        position = pd.Index(self.levels).get_indexer(levels)
+        found = position >= 0
+
+        def take(values, fill):
+            out = np.full(len(position), fill, np.result_type(values, fill))
+            out[found] = values[position[found]]
+            return out
+
+        return GroupSummary(np.asarray(levels), take(self.count, 0),
+                            take(self.mean, np.nan), take(self.m2, 0.0),
+                            self.name)
+
+    def select(self, *levels):
+        """The summary of only these groups, e.g. ``select('CBT')``."""
+        return self.reindex(list(levels))
+
+    @property
+    def var(self):
+        """Sample variance of each group (divide by N - 1)."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    @property
+    def n(self):
+        """Total number of observations."""
+        return int(self.count.sum())
+
+    @property
+    def grand_mean(self):
+        return (self.count * np.where(self.count, self.mean, 0)).sum() / self.n
+
+    @property
+    def ss_between(self):
+        """Between-group sum of squares."""
+        d = np.where(self.count, self.mean, 0) - self.grand_mean
+        return (self.count * d * d).sum()
+
+    @property
+    def ss_within(self):
+        """Within-group sum of squares."""
+        return self.m2.sum()
+
+    def to_frame(self):
+        """The summary as a DataFrame with one row per group."""
+        return pd.DataFrame({'count': self.count, 'mean': self.mean,
+                             'std': self.std},
+                            index=pd.Index(self.levels, name=self.name))
@@ -0,0 +1,251 @@
+"""t-tests and effect sizes from group summaries (05.02).
+
+Like the ANOVAs in ``pythonbook.anova``, these tests only need the size,
+mean and variance of each group, so they take a ``GroupSummary``, which can
+be merged from chunks of a larger data set. Results are laid out like those
+of ``pg.ttest``::
+
+    summary = GroupSummary.from_frame(df, 'grade', 'tutor')
+    ttest(summary, correction=True)
+
+``column_ttests`` and ``group_ttests`` run the same tests on every column
+of a wide DataFrame of outcomes at once, from the column sums and sums of
+squares, with one row of results per column::
+
+    column_ttests(df[['grade_test2']], df[['grade_test1']], paired=True)
+    group_ttests(df, ['grade'], 'tutor')
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .power import t_power, two_sample_t_power
+from .summaries import encode
+
+
+def _two_groups(summary, a, b):
+    # The (count, mean, var) of the two groups to compare
+    if a is None and b is None:
+        nonempty = summary.levels[summary.count > 0]
+        if len(nonempty) != 2:
+            raise ValueError('the summary has %d groups; choose two with a '
+                             'and b' % len(nonempty))
+        a, b = nonempty
+    pair = summary.select(a, b)
+    return pair.count.astype(float), pair.mean, pair.var
+
+
+def _p_value(t, df, alternative):
+    if alternative == 'two-sided':
+        return 2 * stats.t.sf(np.abs(t), df)
+    if alternative == 'greater':
+        return stats.t.sf(t, df)
+    if alternative == 'less':
+        return stats.t.cdf(t, df)
+    raise ValueError("alternative must be 'two-sided', 'greater' or "
+                     "'less', not %r" % (alternative,))
+
+
+def _interval(estimate, se, df, alternative, confidence):
+    # Confidence interval for `estimate`, one-sided if the test is
+    if alternative == 'two-sided':
+        q = stats.t.ppf((1 + confidence) / 2, df)
+        return estimate - q * se, estimate + q * se
+    q = stats.t.ppf(confidence, df)
+    if alternative == 'greater':
+        return estimate - q * se, np.inf * np.ones_like(estimate)
+    return -np.inf * np.ones_like(estimate), estimate + q * se
+
+
+def _result(t, df, alternative, low, high, confidence, d, power,
+            index=('T_test',)):
+    # One row per test; the arguments are scalars or arrays with one value
+    # per row
+    t, df, low, high, d, power = np.broadcast_arrays(
+        *map(np.atleast_1d, (t, df, low, high, d, power)))
+    return pd.DataFrame({'T': t, 'dof': df, 'alternative': alternative,
+                         'p_val': _p_value(t, df, alternative),
+                         'CI%d' % round(100 * confidence):
+                             list(np.round(np.column_stack([low, high]), 2)),
+                         'cohen_d': np.abs(d), 'power': power},
+                        index=list(index))
+
+
+def _hedges_correction(n):
+    # Small-sample correction of Cohen's d for n observations in all
+    return 1 - 3 / (4 * n - 9)
+
+
+def cohen_d(summary, a=None, b=None):
+    """Cohen's d for the difference between two groups.
+
+    The difference between the means divided by the pooled standard
+    deviation, as ``pg.compute_effsize(x, y, eftype='cohen')``.
+    """
+    n, mean, var = _two_groups(summary, a, b)
+    pooled = ((n - 1) * var).sum() / (n.sum() - 2)
+    return (mean[0] - mean[1]) / np.sqrt(pooled)
+
+
+def hedges_g(summary, a=None, b=None):
+    """Cohen's d with the small-sample correction of Hedges (1981)."""
+    n, _, _ = _two_groups(summary, a, b)
+    return cohen_d(summary, a, b) * _hedges_correction(n.sum())
+
+
+def ttest(summary, a=None, b=None, correction=False,
+          alternative='two-sided', confidence=0.95):
+    """Independent samples t-test of group ``a`` against group ``b``.
+
+    With ``correction`` this is Welch's test, which does not assume equal
+    variances; otherwise Student's. ``a`` and ``b`` may be left out if the
+    summary has exactly two groups. ``CI95`` is the confidence interval for
+    the difference between the means, and ``power`` is the power of the
+    test for the observed effect size, as in ``pg.ttest``.
+    """
+    n, mean, var = _two_groups(summary, a, b)
+    difference = mean[0] - mean[1]
+    if correction:
+        se2 = var / n
+        se = np.sqrt(se2.sum())
+        df = se2.sum() ** 2 / (se2 ** 2 / (n - 1)).sum()
+    else:
+        df = int(n.sum()) - 2
+        pooled = ((n - 1) * var).sum() / df
+        se = np.sqrt(pooled * (1 / n).sum())
+    t = difference / se
+    low, high = _interval(difference, se, df, alternative, confidence)
+    d = cohen_d(summary, a, b)
+    power = two_sample_t_power(d, n[0], n[1], alternative=alternative)
+    return _result(t, df, alternative, low, high, confidence, d, power)
+
+
+def one_sample_ttest(summary, mu=0, level=None, alternative='two-sided',
+                     confidence=0.95):
+    """One-sample t-test of the mean of one group against ``mu``.
+
+    ``level`` may be left out if the summary has only one group.
+    ``cohen_d`` is ``(mean - mu) / sd``.
+    """
+    if level is None:
+        nonempty = summary.levels[summary.count > 0]
+        if len(nonempty) != 1:
+            raise ValueError('the summary has %d groups; choose one with '
+                             'level' % len(nonempty))
+        level = nonempty[0]
+    group = summary.select(level)
+    n, mean, sd = float(group.count[0]), group.mean[0], group.std[0]
+    se = sd / np.sqrt(n)
+    t = (mean - mu) / se
+    low, high = _interval(mean, se, n - 1, alternative, confidence)
+    d = (mean - mu) / sd
+    power = t_power(d, n, alternative=alternative)
+    return _result(t, int(n) - 1, alternative, low, high, confidence, d,
+                   power)
+
+
+def _moments(x):
+    # Size, mean and sum of squared deviations of each column of x, leaving
+    # out missing values
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 1:
+        x = x[:, None]
+    n = np.sum(~np.isnan(x), axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.nansum(x, axis=0) / n
+    m2 = np.nansum(np.square(x - mean), axis=0)
+    return n.astype(float), mean, m2
+
+
+def _columns(x):
+    # Labels of the rows of results: the column names of a DataFrame
+    if isinstance(x, pd.DataFrame):
+        return list(x.columns)
+    return list(range(np.shape(x)[1] if np.ndim(x) > 1 else 1))
+
+
+def column_ttests(x, y=None, mu=0, paired=False, correction=False,
+                  alternative='two-sided', confidence=0.95):
+    """t-tests of every column of ``x``, with one row of results per column.
+
+    Without ``y`` these are one-sample tests of each column against ``mu``
+    (a scalar, or one value per column). Otherwise column ``j`` of ``x`` is
+    compared with column ``j`` of ``y``: as paired samples if ``paired``,
+    when the rows of ``x`` and ``y`` are the same units, and otherwise with
+    Student's or, if ``correction``, Welch's independent samples test.
+    Missing values are left out column by column (pairs with a missing
+    value, for paired tests).
+
+    The columns are laid out as in ``pg.ttest``; ``cohen_d`` of paired
+    samples divides the mean difference by the root mean square of the two
+    standard deviations, as pingouin does.
+    """
+    index = _columns(x)
+    if y is None or paired:
+        if y is None:
+            n, mean, m2 = _moments(x)
+            sd = np.sqrt(m2 / (n - 1))
+            d = (mean - mu) / sd
+        else:
+            x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+            pair = ~(np.isnan(x) | np.isnan(y))
+            x, y = np.where(pair, x, np.nan), np.where(pair, y, np.nan)
+            n, mean, m2 = _moments(x - y)
+            sd = np.sqrt(m2 / (n - 1))
+            nx, _, m2x = _moments(x)
+            _, _, m2y = _moments(y)
+            d = mean / np.sqrt((m2x + m2y) / (2 * (nx - 1)))
+            mu = 0
+        se = sd / np.sqrt(n)
+        t = (mean - mu) / se
+        low, high = _interval(mean, se, n - 1, alternative, confidence)
+        power = t_power(d, n, alternative=alternative)
+        return _result(t, (n - 1).astype(int), alternative, low, high,
+                       confidence, d, power, index)
+    nx, mean_x, m2x = _moments(x)
+    ny, mean_y, m2y = _moments(y)
+    difference = mean_x - mean_y
+    pooled = (m2x + m2y) / (nx + ny - 2)
+    if correction:
+        se2x, se2y = m2x / (nx - 1) / nx, m2y / (ny - 1) / ny
+        se = np.sqrt(se2x + se2y)
+        df = (se2x + se2y) ** 2 \
+            / (se2x ** 2 / (nx - 1) + se2y ** 2 / (ny - 1))
+    else:
+        se = np.sqrt(pooled * (1 / nx + 1 / ny))
+        df = (nx + ny - 2).astype(int)
+    t = difference / se
+    low, high = _interval(difference, se, df, alternative, confidence)
+    d = difference / np.sqrt(pooled)
+    power = two_sample_t_power(d, nx, ny, alternative=alternative)
+    return _result(t, df, alternative, low, high, confidence, d, power,
+                   index)
+
+
+def group_ttests(data, dvs, between, a=None, b=None, correction=False,
+                 alternative='two-sided', confidence=0.95):
+    """Independent samples t-tests of group ``a`` against group ``b``.
+
+    ``data`` is a long DataFrame with the outcomes ``dvs`` (a list of
+    columns) and the grouping column ``between``; ``a`` and ``b`` may be
+    left out if it has exactly two groups. Returns one row of results per
+    outcome, as ``column_ttests``.
+    """
+    levels, codes = encode(data[between])
+    if a is None and b is None:
+        observed = levels[np.bincount(codes[codes >= 0],
+                                      minlength=len(levels)) > 0]
+        if len(observed) != 2:
+            raise ValueError('%s has %d groups; choose two with a and b'
+                             % (between, len(observed)))
+        a, b = observed
+    position = pd.Index(levels).get_indexer([a, b])
+    if (position < 0).any():
+        raise ValueError('%r is not a group of %s'
+                         % ([a, b][int(np.argmin(position))], between))
+    dvs = list(dvs)
+    return column_ttests(data.loc[codes == position[0], dvs],
+                         data.loc[codes == position[1], dvs],
+                         correction=correction, alternative=alternative,
+                         confidence=confidence)
@@ -2,61 +2,811 @@
 # coding: utf-8
 
 import os
+import re
+import ast
+import json
+import pickle
+import shutil
+import sys
+import time
 import argparse
 import glob
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.util import Finalize
 
 import nbformat
+from jupyter_client import KernelManager
+from jupyter_client.asynchronous import AsyncKernelClient
+from nbclient.exceptions import DeadKernelError
 from nbconvert.preprocessors import ExecutePreprocessor
 from nbconvert.preprocessors.execute import CellExecutionError
 
-# Parse args
-parser = argparse.ArgumentParser(description="Runs a set of Jupyter \
-                                              notebooks.")
-file_text = """ Notebook file(s) to be run, e.g. '*.ipynb' (default),
-'my_nb1.ipynb', 'my_nb1.ipynb my_nb2.ipynb', 'my_dir/*.ipynb'
-"""
-parser.add_argument('file_list', metavar='F', type=str, nargs='*', 
-    help=file_text)
-parser.add_argument('-t', '--timeout', help='Length of time (in secs) a cell \
-    can run before raising TimeoutError (default 600).', default=600, 
-    required=False)
-parser.add_argument('-p', '--run-path', help='The path the notebook will be \
-    run from (default pwd).', default='.', required=False)
-args = parser.parse_args()
-print('Args:', args)
-if not args.file_list: # Default file_list
-    args.file_list = glob.glob('*.ipynb')
-
-# Check list of notebooks
-notebooks = []
-print('Notebooks to run:')
-for f in args.file_list:
+# Exit codes reported for each notebook in the summary
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_TIMEOUT = 2
+
+KERNEL_NAME = 'python3'
+
+# Data files referenced by the notebooks, e.g. '.../pythonbook/main/Data/chico.csv'
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(HERE, 'Data')
+CHAPTERS_DIR = os.path.join(HERE, 'Chapters')
+DATA_FILE = re.compile(r'Data/([\w.-]+\.csv)')
+
+# Imported by warm kernels before they are handed to a notebook. The modules
+# are only loaded into sys.modules; no names are bound in the user namespace.
+PRELOAD_MODULES = ['numpy', 'pandas', 'scipy.stats', 'matplotlib.pyplot',
+                   'seaborn', 'statsmodels.api', 'statsmodels.formula.api',
+                   'pingouin', 'myst_nb']
+PRELOAD = '''
+def _nb_preload(names):
+    import importlib
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+_nb_preload(%r)
+del _nb_preload
+''' % PRELOAD_MODULES
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Runs a set of Jupyter \
+                                                  notebooks.")
+    file_text = """ Notebook file(s) to be run, e.g. '*.ipynb' (default),
+    'my_nb1.ipynb', 'my_nb1.ipynb my_nb2.ipynb', 'my_dir/*.ipynb'
+    """
+    parser.add_argument('file_list', metavar='F', type=str, nargs='*',
+        help=file_text)
+    parser.add_argument('-t', '--timeout', help='Length of time (in secs) a cell \
+        can run before raising TimeoutError (default 600).', default=600,
+        required=False)
+    parser.add_argument('-p', '--run-path', help='The path the notebook will be \
+        run from (default pwd).', default='.', required=False)
+    parser.add_argument('-j', '--jobs', help='Number of notebooks to run at \
+        the same time, each in its own worker process and kernel (default 1). \
+        Use 0 for one job per CPU.', type=int, default=1, required=False)
+    parser.add_argument('-c', '--cache-dir', help='Directory for the execution \
+        cache (default .nbcache next to this script).',
+        default=os.path.join(HERE, '.nbcache'), required=False)
+    parser.add_argument('--no-cache', help='Execute every notebook, ignoring \
+        the execution cache.', action='store_true')
+    parser.add_argument('-w', '--warm-kernels', help='Number of kernels each \
+        job keeps started, with the scientific stack already imported, so \
+        that the next notebook does not wait for kernel startup (default 0).',
+        type=int, default=0, required=False)
+    parser.add_argument('-l', '--local-data', help='Read the datasets the \
+        notebooks load from GitHub from the local Data/ directory instead \
+        (see Chapters/pythonbook/datasets.py).', action='store_true')
+    parser.add_argument('-i', '--incremental', help='Only re-execute the cells \
+        affected by edits since the last run, restoring the state of the \
+        others from snapshots kept in the cache directory.',
+        action='store_true')
+    args = parser.parse_args()
+    # The incremental records are kept in the cache directory
+    if args.incremental and args.no_cache:
+        parser.error('--incremental cannot be combined with --no-cache')
+    return args
+
+
+def find_notebooks(file_list):
     # Find notebooks but not notebooks previously output from this script
-    if f.endswith('.ipynb') and not f.endswith('_out.ipynb'):
-        print(f[:-6])
-        notebooks.append(f[:-6]) # Want the filename without '.ipynb'
-
-# Execute notebooks and output
-num_notebooks = len(notebooks)
-print('*****')
-for i, n in enumerate(notebooks):
+    notebooks = []
+    for f in file_list:
+        if f.endswith('.ipynb') and not f.endswith('_out.ipynb'):
+            notebooks.append(f[:-6]) # Want the filename without '.ipynb'
+    return notebooks
+
+
+def code_cells(nb):
+    # Code cells that actually contain code; empty cells have no outputs
+    return [c for c in nb.cells if c.cell_type == 'code' and c.source.strip()]
+
+
+def normalize_source(source):
+    # Ignore trailing whitespace and blank lines around the code
+    return '\n'.join(line.rstrip() for line in source.strip().splitlines())
+
+
+def data_key(sources):
+    # Hash of the contents of every Data/*.csv file mentioned in the code
+    h = hashlib.sha256()
+    for name in sorted(set(DATA_FILE.findall('\n'.join(sources)))):
+        h.update(b'\0data\0' + name.encode() + b'\0')
+        path = os.path.join(DATA_DIR, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                h.update(hashlib.sha256(f.read()).digest())
+        else:
+            h.update(b'missing')
+    return h.hexdigest()
+
+
+def module_imports(tree, package=None):
+    # Dotted names of the modules imported in the syntax tree, with relative
+    # imports resolved against `package`. `from a import b` gives both a and
+    # a.b, as b may be a submodule; __import__('a') and import_module('a')
+    # count too.
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.update(a.name for a in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level == 0:
+                base = node.module
+            elif package is not None:
+                parts = package.split('.')
+                parts = parts[:len(parts) - node.level + 1]
+                base = '.'.join(parts + [node.module] if node.module
+                                else parts)
+            else:
+                continue
+            modules.add(base)
+            modules.update(base + '.' + a.name for a in node.names
+                           if a.name != '*')
+        elif isinstance(node, ast.Call) and node.args:
+            func = getattr(node.func, 'id', getattr(node.func, 'attr', None))
+            arg = node.args[0]
+            if (func in ('__import__', 'import_module')
+                    and isinstance(arg, ast.Constant)
+                    and isinstance(arg.value, str)):
+                modules.add(arg.value)
+    return modules
+
+
+def imported_modules(sources):
+    # Dotted names of the modules imported by the code cells
+    modules = set()
+    for source in sources:
+        lines = ['' if line.lstrip().startswith(('%', '!')) else line
+                 for line in source.splitlines()]
+        try:
+            tree = ast.parse('\n'.join(lines))
+        except SyntaxError:
+            continue
+        modules |= module_imports(tree)
+    return modules
+
+
+def module_files(name, roots):
+    # (module, path, is_package) of each local file that `import name` runs,
+    # from the first of `roots` holding its top-level module or package
+    parts = name.split('.')
+    for root in roots:
+        files, path = [], root
+        for i, part in enumerate(parts):
+            path = os.path.join(path, part)
+            module = '.'.join(parts[:i + 1])
+            if os.path.isdir(path):
+                init = os.path.join(path, '__init__.py')
+                if os.path.isfile(init):
+                    files.append((module, init, True))
+            elif os.path.isfile(path + '.py'):
+                files.append((module, path + '.py', False))
+                break
+            else:
+                break
+        if files:
+            return files
+    return []
+
+
+def local_modules(sources, run_path='.'):
+    """Paths of the local Python files that the code imports.
+
+    Modules and packages are looked up in ``run_path`` (the kernel's working
+    directory) and in ``Chapters`` (for ``pythonbook``), and the imports of
+    the files found are followed in turn, so that only the helpers the code
+    actually uses are listed.
+    """
+    roots = list(dict.fromkeys(os.path.abspath(p)
+                               for p in (run_path, CHAPTERS_DIR)))
+    paths, seen = set(), set()
+    todo = list(imported_modules(sources))
+    while todo:
+        name = todo.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        for module, path, is_package in module_files(name, roots):
+            if path in paths:
+                continue
+            paths.add(path)
+            with open(path, 'rb') as f:
+                try:
+                    tree = ast.parse(f.read())
+                except SyntaxError:
+                    continue
+            package = module if is_package else module.rpartition('.')[0]
+            todo.extend(module_imports(tree, package))
+    return sorted(paths)
+
+
+def startup_code(extra_arguments):
+    # Lines the kernel runs at startup (see kernel_arguments)
+    prefix = '--IPKernelApp.exec_lines='
+    return [a[len(prefix):] for a in extra_arguments if a.startswith(prefix)]
+
+
+def helpers_key(sources, run_path='.'):
+    """Hash of the local Python code that the notebook's code imports.
+
+    That is the files listed by ``local_modules``, so that editing a helper
+    invalidates the outputs built with it, and only those.
+    """
+    h = hashlib.sha256()
+    for path in local_modules(sources, run_path):
+        h.update(b'\0helper\0' + path.encode() + b'\0')
+        with open(path, 'rb') as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def cache_key(nb, kernel_name=KERNEL_NAME, run_path='.', extra_arguments=()):
+    """Hash of everything that can change a notebook's outputs.
+
+    That is the normalized code cells, the kernel name and the arguments it
+    is started with (see ``kernel_arguments``), the contents of every
+    ``Data/*.csv`` file the code refers to and the sources of the local
+    modules it can import (see ``helpers_key``). Markdown cells, metadata
+    and whitespace-only edits do not change the key.
+    """
+    h = hashlib.sha256()
+    h.update(kernel_name.encode())
+    for argument in extra_arguments:
+        h.update(b'\0argument\0' + argument.encode())
+    sources = [normalize_source(c.source) for c in code_cells(nb)]
+    for source in sources:
+        h.update(b'\0cell\0' + source.encode())
+    h.update(data_key(sources).encode())
+    h.update(helpers_key(sources + startup_code(extra_arguments),
+                         run_path).encode())
+    return h.hexdigest()
+
+
+def restore_outputs(nb, cached):
+    # Copy outputs of the cached run onto the current notebook. The code is
+    # identical (same key), so the code cells pair up one to one.
+    for cell, done in zip(code_cells(nb), code_cells(cached)):
+        cell.outputs = done.outputs
+        cell.execution_count = done.execution_count
+    for cell in nb.cells:
+        if cell.cell_type == 'code' and not cell.source.strip():
+            cell.outputs = []
+            cell.execution_count = None
+
+
+def write_if_changed(nb, path):
+    # Leave the file (and its modification time) alone if nothing changed
+    text = nbformat.writes(nb)
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read() == text:
+                return
+    with open(path, mode='wt') as f:
+        f.write(text)
+
+
+def store_in_cache(nb, path):
+    # Write to a temporary file first so that parallel jobs never see a
+    # half-written cache entry
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, mode='wt') as f:
+        nbformat.write(nb, f)
+    os.replace(tmp, path)
+
+
+# Helpers defined (silently) in the kernel by IncrementalExecutePreprocessor.
+# A snapshot holds the names one cell binds: modules by name, everything else
+# pickled with dill where available.
+SNAPSHOT_HELPERS = """
+def _nb_snapshot(path, names):
+    import pickle, types
+    try:
+        import dill as pickler
+    except ImportError:
+        import pickle as pickler
+    ns = globals()
+    saved = {'modules': {}, 'values': {}, 'failed': []}
+    for name in names:
+        if name not in ns:
+            continue
+        if isinstance(ns[name], types.ModuleType):
+            saved['modules'][name] = ns[name].__name__
+            continue
+        try:
+            saved['values'][name] = pickler.dumps(ns[name])
+        except Exception:
+            saved['failed'].append(name)
+    with open(path, 'wb') as f:
+        pickle.dump(saved, f)
+
+def _nb_restore(paths):
+    import importlib, pickle
+    try:
+        import dill as pickler
+    except ImportError:
+        import pickle as pickler
+    for path in paths:
+        with open(path, 'rb') as f:
+            saved = pickle.load(f)
+        for name, module in saved['modules'].items():
+            globals()[name] = importlib.import_module(module)
+        for name, value in saved['values'].items():
+            globals()[name] = pickler.loads(value)
+"""
+
+
+def root_name(node):
+    # 'df' for df, df['x'], df.x.y, df.loc[0] ...
+    while isinstance(node, (ast.Attribute, ast.Subscript)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def cell_names(source):
+    """Simple def/use analysis of a code cell.
+
+    Returns ``(binds, imports, uses)``: the names the cell assigns or may
+    modify (``x = ...``, ``x[0] = ...``, ``x.append(...)``, ``def x``), the
+    names bound by import statements, and the names it reads. Returns
+    ``None`` if the cell cannot be parsed. IPython magics and shell escapes
+    are ignored.
+    """
+    lines = ['' if line.lstrip().startswith(('%', '!')) else line
+             for line in source.splitlines()]
+    try:
+        tree = ast.parse('\n'.join(lines))
+    except SyntaxError:
+        return None
+    binds, imports, uses = set(), set(), set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                uses.add(node.id)
+            else:
+                binds.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                               ast.ClassDef)):
+            binds.add(node.name)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                imports.add((alias.asname or alias.name).split('.')[0])
+        elif isinstance(node, (ast.Attribute, ast.Subscript)):
+            if not isinstance(node.ctx, ast.Load):
+                binds.add(root_name(node))
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            binds.add(root_name(node.func.value))
+    binds.discard(None)
+    return binds, imports, uses
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class IncrementalExecutePreprocessor(ExecutePreprocessor):
+    """Re-execute only the code cells affected by an edit.
+
+    After every executed code cell the names it binds are pickled into a
+    snapshot in ``record_dir``, and the cell hashes and outputs are saved in
+    ``record.json``. On the next run a cell is skipped, and its names are
+    restored from the old snapshot, when its code is unchanged and it does
+    not read or modify a name bound by a cell that had to run. Everything up
+    to the first edited cell is therefore restored rather than re-executed.
+
+    State outside the user namespace (matplotlib settings, open files,
+    objects modified by a function call) is not tracked, so use a full run
+    for the final build.
+    """
+
+    def __init__(self, record_dir, **kw):
+        super().__init__(**kw)
+        self.record_dir = record_dir
+
+    def load_record(self, nb):
+        sources = [normalize_source(c.source) for c in code_cells(nb)]
+        path = os.path.join(self.record_dir, 'record.json')
+        self.data = data_key(sources)
+        # nbclient adds its own arguments when it starts the kernel
+        self.arguments = list(self.extra_arguments)
+        self.helper_sources = helpers_key(
+            sources + startup_code(self.arguments), self.run_path)
+        self.previous = []
+        if os.path.exists(path):
+            with open(path) as f:
+                record = json.load(f)
+            # Different data, helpers or kernel: nothing from the old run
+            # can be reused
+            if (record['kernel'] == self.kernel_name
+                    and record.get('arguments') == self.arguments
+                    and record['data'] == self.data
+                    and record.get('helpers') == self.helper_sources):
+                self.previous = record['cells']
+        self.cells = []
+        prefix = hashlib.sha256(self.kernel_name.encode())
+        for source in sources:
+            prefix.update(b'\0cell\0' + source.encode())
+            self.cells.append({'hash': hashlib.sha256(source.encode()).hexdigest(),
+                               'prefix': prefix.hexdigest(),
+                               'names': cell_names(source)})
+        # Import statements rebind the same modules, so calling a function
+        # from a module (np.mean(...)) does not make the module "modified"
+        self.modules = set()
+        for c in self.cells:
+            if c['names']:
+                self.modules |= c['names'][1]
+        for c in self.cells:
+            if c['names']:
+                c['names'][0].difference_update(self.modules)
+
+    def save_record(self):
+        record = {'kernel': self.kernel_name,
+                  'arguments': self.arguments, 'data': self.data,
+                  'helpers': self.helper_sources,
+                  'cells': [{'hash': c['hash'], 'prefix': c['prefix'],
+                             'ok': c['ok'],
+                             'outputs': c['outputs'],
+                             'execution_count': c['execution_count']}
+                            for c in self.cells]}
+        with open(os.path.join(self.record_dir, 'record.json'), 'w') as f:
+            json.dump(record, f)
+        # Drop snapshots of cells that no longer exist
+        keep = {c['prefix'] + '.pkl' for c in self.cells} | {'record.json'}
+        for name in os.listdir(self.record_dir):
+            if name not in keep:
+                os.remove(os.path.join(self.record_dir, name))
+
+    def snapshot_path(self, prefix):
+        return os.path.join(self.record_dir, prefix + '.pkl')
+
+    def run_hidden(self, code):
+        reply = self.wait_for_reply(self.kc.execute(code, silent=True,
+                                                    store_history=False))
+        if reply is None or reply['content']['status'] != 'ok':
+            raise SnapshotError('Could not save or restore kernel state')
+
+    def preprocess(self, nb, resources=None, km=None):
+        os.makedirs(self.record_dir, exist_ok=True)
+        self.run_path = ((resources or {}).get('metadata', {}).get('path')
+                         or '.')
+        self.load_record(nb)
+        self.position = {id(c): i for i, c in enumerate(code_cells(nb))}
+        self.dirty = set()
+        self.all_dirty = False
+        self.pending = []
+        self.helpers = False
+        self.skipped = 0
+        nb, resources = super().preprocess(nb, resources, km)
+        self.save_record()
+        return nb, resources
+
+    def can_skip(self, c, old):
+        if (self.all_dirty or old is None or not old['ok']
+                or c['names'] is None
+                or not os.path.exists(self.snapshot_path(old['prefix']))):
+            return False
+        binds, imports, uses = c['names']
+        return not (binds | uses) & self.dirty
+
+    def preprocess_cell(self, cell, resources, index):
+        if id(cell) not in self.position:
+            return super().preprocess_cell(cell, resources, index)
+        i = self.position[id(cell)]
+        c = self.cells[i]
+        # The old run of this cell: same code at the same position
+        old = None
+        if i < len(self.previous) and self.previous[i]['hash'] == c['hash']:
+            old = self.previous[i]
+        path = self.snapshot_path(c['prefix'])
+
+        if self.can_skip(c, old):
+            # Restore the outputs and (later, in one go) the names it binds
+            cell.outputs = [nbformat.from_dict(o) for o in old['outputs']]
+            cell.execution_count = old['execution_count']
+            if old['prefix'] != c['prefix']:
+                shutil.copyfile(self.snapshot_path(old['prefix']), path)
+            self.pending.append(path)
+            self.dirty -= c['names'][0] | c['names'][1]
+            self.skipped += 1
+            ok = True
+        else:
+            if not self.helpers:
+                self.run_hidden(SNAPSHOT_HELPERS)
+                self.helpers = True
+            if self.pending:
+                self.run_hidden('_nb_restore(%r)' % self.pending)
+                self.pending = []
+            cell, resources = super().preprocess_cell(cell, resources, index)
+            ok = c['names'] is not None
+            if ok:
+                binds, imports, uses = c['names']
+                self.dirty |= binds
+                self.run_hidden('_nb_snapshot(%r, %r)' %
+                                (path, sorted(binds | imports)))
+                with open(path, 'rb') as f:
+                    ok = not pickle.load(f)['failed']
+            else:
+                self.all_dirty = True
+        c.update(ok=ok, outputs=cell.outputs,
+                 execution_count=cell.execution_count)
+        return cell, resources
+
+
+def kernel_arguments(local_data=False):
+    # Lines run by ipykernel at startup; they bind no names for the notebook
+    if not local_data:
+        return []
+    lines = ["__import__('sys').path.insert(0, %r)" % CHAPTERS_DIR,
+             "__import__('pythonbook.datasets').datasets.install()"]
+    return ['--IPKernelApp.exec_lines=' + line for line in lines]
+
+
+class KernelPool:
+    """Kernels started ahead of time with ``PRELOAD_MODULES`` imported.
+
+    Every notebook is handed a kernel that has never run anything else, so
+    notebooks stay isolated, and a replacement starts warming up straight
+    away while the notebook runs. Replacements are only started for
+    notebooks still queued, and the first notebook runs in an ordinary
+    kernel while the pool warms up, so a kernel is never warmed that no
+    notebook will use. Jupyter kernels cannot be forked, so the pool holds
+    started kernels rather than forked children.
+    """
+
+    def __init__(self, size, run_path, extra_arguments=(),
+                 kernel_name=KERNEL_NAME):
+        self.size = size
+        self.cwd = os.path.abspath(run_path)
+        self.extra_arguments = list(extra_arguments)
+        self.kernel_name = kernel_name
+        self.kernels = []
+        # Also runs when a --jobs worker process exits; the kernels are
+        # started by the first get
+        Finalize(self, self.shutdown, exitpriority=10)
+
+    def start(self):
+        km = KernelManager(kernel_name=self.kernel_name)
+        km.start_kernel(cwd=self.cwd, extra_arguments=self.extra_arguments)
+        try:
+            kc = km.client()
+            kc.start_channels()
+            msg_id = kc.execute(PRELOAD, silent=True, store_history=False)
+        except Exception:
+            km.shutdown_kernel(now=True)
+            raise
+        return km, kc, msg_id
+
+    def resize(self, size):
+        while len(self.kernels) < size:
+            self.kernels.append(self.start())
+        while len(self.kernels) > size:
+            km, kc, msg_id = self.kernels.pop()
+            kc.stop_channels()
+            km.shutdown_kernel(now=True)
+
+    def get(self, timeout=60, queued=None):
+        """Hand over the kernel manager of the oldest warm kernel.
+
+        ``queued`` is how many more notebooks will ask for a kernel after
+        this one (``None`` if not known): the pool keeps at most that many
+        warming. Returns ``None`` if no kernel has been warmed yet, for the
+        notebook to start its own. Waits up to ``timeout`` seconds for the
+        imports to finish, and raises ``queue.Empty`` if they do not, after
+        shutting the kernel down.
+        """
+        size = self.size if queued is None else min(self.size, queued)
+        if not self.kernels:
+            # Warming one up now would only add the imports to this
+            # notebook's startup
+            self.resize(size)
+            return None
+        km, kc, msg_id = self.kernels.pop(0)
+        # Wait for the imports to finish, then hand over the kernel manager
+        try:
+            self.resize(size)
+            while kc.get_shell_msg(timeout=timeout)['parent_header'].get(
+                    'msg_id') != msg_id:
+                pass
+        except BaseException:
+            km.shutdown_kernel(now=True)
+            raise
+        finally:
+            kc.stop_channels()
+        # nbclient polls for output and for a dead kernel concurrently, which
+        # needs an asynchronous client: with the blocking default, a kernel
+        # that dies mid-cell leaves the run waiting for output forever
+        km.client_factory = AsyncKernelClient
+        return km
+
+    def shutdown(self):
+        self.resize(0)
+
+
+# One pool per process, created by the first notebook that asks for one
+_kernel_pool = None
+
+
+def warm_kernel(size, run_path, extra_arguments=(), timeout=60, queued=None):
+    global _kernel_pool
+    if _kernel_pool is None:
+        _kernel_pool = KernelPool(size, run_path, extra_arguments)
+    return _kernel_pool.get(timeout, queued)
+
+
+def run_notebook(n, timeout, run_path, cache_dir=None, incremental=False,
+                 warm_kernels=0, local_data=False, queued=None):
+    """Execute notebook ``n`` (without '.ipynb') and write ``n + '_out.ipynb'``.
+
+    If ``cache_dir`` is given and holds a successful run of the same code
+    (see ``cache_key``), its outputs are restored without starting a kernel.
+    Otherwise, with ``incremental``, only the cells affected by edits since
+    the last run are executed (see ``IncrementalExecutePreprocessor``); the
+    records of the last run are kept in ``cache_dir``, which is required.
+    With ``warm_kernels`` the notebook runs in a kernel from a ``KernelPool``,
+    which warms kernels for the ``queued`` notebooks this process will run
+    next (see ``KernelPool.get``).
+    With ``local_data`` the kernel reads datasets from ``Data/`` rather than
+    from GitHub.
+
+    Returns a dict with the notebook name, status, exit code and wall time,
+    so that results from worker processes can be collected into one summary.
+    """
+    if incremental and not cache_dir:
+        raise ValueError('incremental runs keep their records in cache_dir')
     n_out = n + '_out'
+    start = time.perf_counter()
+    status, code = 'ok', EXIT_OK
     with open(n + '.ipynb') as f:
         nb = nbformat.read(f, as_version=4)
-        ep = ExecutePreprocessor(timeout=int(args.timeout), kernel_name='python3')
+
+    extra_arguments = kernel_arguments(local_data)
+    cached = None
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        key = cache_key(nb, run_path=run_path, extra_arguments=extra_arguments)
+        cached = os.path.join(cache_dir, key + '.ipynb')
+        if os.path.exists(cached):
+            with open(cached) as f:
+                restore_outputs(nb, nbformat.read(f, as_version=4))
+            write_if_changed(nb, n_out + '.ipynb')
+            return {'notebook': n, 'status': 'cached', 'exit_code': EXIT_OK,
+                    'seconds': time.perf_counter() - start}
+
+    if incremental:
+        # Absolute, as the kernel writes the snapshots from run_path
+        name = hashlib.sha256(os.path.abspath(n).encode()).hexdigest()
+        record_dir = os.path.join(os.path.abspath(cache_dir), 'cells', name)
+        ep = IncrementalExecutePreprocessor(record_dir, timeout=int(timeout),
+                                            kernel_name=KERNEL_NAME,
+                                            extra_arguments=extra_arguments)
+    else:
+        ep = ExecutePreprocessor(timeout=int(timeout), kernel_name=KERNEL_NAME,
+                                 extra_arguments=extra_arguments)
+    km = None
+    try:
+        # Inside the try, so that a kernel that fails to start or to warm up
+        # is reported as a failure of this notebook
+        if warm_kernels > 0:
+            km = warm_kernel(warm_kernels, run_path, extra_arguments,
+                             int(timeout), queued)
         try:
+            ep.preprocess(nb, {'metadata': {'path': run_path}}, km)
+        except SnapshotError as e:
+            print('%s in "%s", running all cells.' % (e, n))
+            ep = ExecutePreprocessor(timeout=int(timeout),
+                                     kernel_name=KERNEL_NAME,
+                                     extra_arguments=extra_arguments)
+            ep.preprocess(nb, {'metadata': {'path': run_path}})
+        restored = isinstance(ep, IncrementalExecutePreprocessor) and ep.skipped
+        if restored:
+            status = 'ok (%d skipped)' % ep.skipped
+        # Only successful runs of every cell are worth keeping: outputs
+        # restored by an incremental run stay in its record, so that a full
+        # run still executes the notebook
+        if cached and not restored:
+            store_in_cache(nb, cached)
+    except CellExecutionError:
+        status, code = 'error', EXIT_ERROR
+        msg = 'Error executing the notebook "%s".\n' % n
+        msg += 'See notebook "%s" for the traceback.' % n_out
+        print(msg)
+    except TimeoutError:
+        status, code = 'timeout', EXIT_TIMEOUT
+        msg = 'Timeout executing the notebook "%s".\n' % n
+        print(msg)
+    except DeadKernelError:
+        status, code = 'error', EXIT_ERROR
+        print('The kernel died while executing the notebook "%s".' % n)
+    except Exception as e:
+        # Report anything else as a failure of this notebook rather than
+        # letting it abort a --jobs run without a summary
+        status, code = 'error', EXIT_ERROR
+        print('Error running the notebook "%s": %r' % (n, e))
+    finally:
+        # Warm kernels are used once; the pool already started a new one
+        if km is not None:
+            if ep.kc is not None:
+                ep.kc.stop_channels()
+            km.shutdown_kernel(now=True)
+        # Write output file
+        write_if_changed(nb, n_out + '.ipynb')
+    return {'notebook': n, 'status': status, 'exit_code': code,
+            'seconds': time.perf_counter() - start}
+
+
+def print_summary(results, elapsed):
+    width = max([len('Notebook')] + [len(r['notebook']) for r in results])
+    status = max([len('Status')] + [len(r['status']) for r in results])
+    print('*****')
+    print('%-*s  %-*s  %4s  %9s' % (width, 'Notebook', status, 'Status',
+                                    'Exit', 'Time (s)'))
+    for r in results:
+        print('%-*s  %-*s  %4d  %9.1f' % (width, r['notebook'], status,
+                                          r['status'], r['exit_code'],
+                                          r['seconds']))
+    failed = sum(r['exit_code'] != EXIT_OK for r in results)
+    print('%d notebook(s) run, %d failed, %.1f s wall time' % (len(results),
+                                                              failed, elapsed))
+
+
+def main():
+    args = parse_args()
+    print('Args:', args)
+    if not args.file_list: # Default file_list
+        args.file_list = glob.glob('*.ipynb')
+
+    # Check list of notebooks
+    notebooks = find_notebooks(args.file_list)
+    print('Notebooks to run:')
+    for n in notebooks:
+        print(n)
+
+    # Execute notebooks and output
+    num_notebooks = len(notebooks)
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    jobs = max(1, min(jobs, num_notebooks))
+    cache_dir = None if args.no_cache else args.cache_dir
+    print('*****')
+    start = time.perf_counter()
+    results = []
+    # Notebooks each job will still run after notebook i, roughly, when the
+    # notebooks are taken in order; warm kernels are only started for those
+    queued = [-(-(num_notebooks - i - 1) // jobs)
+              for i in range(num_notebooks)]
+    if jobs == 1:
+        for i, n in enumerate(notebooks):
             print('Running', n, ':', i, '/', num_notebooks)
-            out = ep.preprocess(nb, {'metadata': {'path': args.run_path}})
-        except CellExecutionError:
-            out = None
-            msg = 'Error executing the notebook "%s".\n' % n
-            msg += 'See notebook "%s" for the traceback.' % n_out
-            print(msg)
-        except TimeoutError:
-            msg = 'Timeout executing the notebook "%s".\n' % n
-            print(msg)
-        finally:
-            # Write output file
-            with open(n_out + '.ipynb', mode='wt') as f:
-                nbformat.write(nb, f)
-                
\ No newline at end of file
+            results.append(run_notebook(n, args.timeout, args.run_path,
+                                        cache_dir, args.incremental,
+                                        args.warm_kernels, args.local_data,
+                                        queued[i]))
+    else:
+        # Notebooks are independent, so each one gets its own worker process
+        # (and therefore its own kernel); the total run time is then roughly
+        # that of the slowest notebook rather than the sum of all of them.
+        print('Running', num_notebooks, 'notebooks with', jobs, 'jobs')
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(run_notebook, n, args.timeout,
+                                   args.run_path, cache_dir,
+                                   args.incremental, args.warm_kernels,
+                                   args.local_data, queued[i]): n
+                       for i, n in enumerate(notebooks)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                print('Finished', result['notebook'], ':', done, '/',
+                      num_notebooks, '(%s)' % result['status'])
+                results.append(result)
+        # Report in the order the notebooks were given
+        order = {n: i for i, n in enumerate(notebooks)}
+        results.sort(key=lambda r: order[r['notebook']])
+
+    print_summary(results, time.perf_counter() - start)
+    return max([r['exit_code'] for r in results], default=EXIT_OK)
+
+
+if __name__ == '__main__':
+    sys.exit(main())